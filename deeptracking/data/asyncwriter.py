@@ -0,0 +1,115 @@
+"""
+    Background writer of dataset frames : frames are encoded and written while the caller keeps producing samples. The
+    number of samples waiting to be written is bounded, submit blocks when the writer is behind.
+
+    Formats with one file per frame (parallel_dump) are written by a pool of processes (png encoding holds the GIL),
+    formats with one storage per folder (shard, chunk) are written by a single thread of the main process.
+"""
+
+import atexit
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+
+def dump_frames(path, frames, frame_class):
+    for frame in frames:
+        frame.dump(path)
+    frame_class.flush(path)
+
+
+class AsyncWriter:
+    def __init__(self, path, frame_class, worker_qty=4, max_pending=64):
+        """
+        :param path: folder of the frames
+        :param frame_class: Frame class of the dataset
+        :param worker_qty: number of writing processes (formats with parallel_dump)
+        :param max_pending: maximum number of samples submitted and not written yet
+        """
+        self.path = path
+        self.frame_class = frame_class
+        self.worker_qty = worker_qty
+        self.executor = None
+        self.pending = threading.BoundedSemaphore(max_pending)
+        # samples submitted whose done callback has not returned yet (the future is done before its callbacks run)
+        self.outstanding = 0
+        self.outstanding_changed = threading.Condition()
+        self.futures = []
+        # exceptions of the on_written callbacks (run by the executor, they would only be logged)
+        self.callback_errors = []
+        self.closed = False
+        # frames submitted before the interpreter exits are written (and the storage index flushed)
+        atexit.register(self.close)
+
+    def executor_(self):
+        if self.executor is None:
+            if self.frame_class.parallel_dump:
+                self.executor = ProcessPoolExecutor(self.worker_qty)
+            else:
+                self.executor = ThreadPoolExecutor(1)
+        return self.executor
+
+    def submit(self, frames, on_written=None):
+        """
+        Write the frames of one sample in the background, blocks while max_pending samples are waiting
+        :param frames: list of Frame, dumped in order
+        :param on_written: function called (from another thread) once the frames are written, flush raises its
+                           exceptions
+        :return:
+        """
+        if self.closed:
+            raise Exception("AsyncWriter is closed")
+        self.pending.acquire()
+        with self.outstanding_changed:
+            self.outstanding += 1
+        try:
+            future = self.executor_().submit(dump_frames, self.path, frames, self.frame_class)
+        except:
+            self.sample_done_()
+            raise
+        future.add_done_callback(lambda future: self.done_(future, on_written))
+        self.futures.append(future)
+        if len(self.futures) > 1024:
+            self.futures = [future for future in self.futures if not future.done() or future.exception()]
+
+    def done_(self, future, on_written):
+        try:
+            if on_written is not None and not future.cancelled() and future.exception() is None:
+                on_written()
+        except Exception as e:
+            self.callback_errors.append(e)
+        finally:
+            self.sample_done_()
+
+    def sample_done_(self):
+        self.pending.release()
+        with self.outstanding_changed:
+            self.outstanding -= 1
+            self.outstanding_changed.notify_all()
+
+    def flush(self):
+        """
+        Wait until every submitted frame is written and its on_written has returned, then flush the storage of the
+        frame class
+        :return:
+        """
+        with self.outstanding_changed:
+            self.outstanding_changed.wait_for(lambda: self.outstanding == 0)
+        futures, self.futures = self.futures, []
+        errors = [future.exception() for future in futures if future.exception() is not None]
+        callback_errors, self.callback_errors = self.callback_errors, []
+        self.frame_class.flush(self.path)
+        if errors:
+            raise Exception("{} samples could not be written : {}".format(len(errors), errors[0]))
+        if callback_errors:
+            raise Exception("on_written failed for {} samples : {}".format(len(callback_errors), callback_errors[0]))
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        atexit.unregister(self.close)
+        try:
+            self.flush()
+        finally:
+            if self.executor is not None:
+                self.executor.shutdown(wait=True)
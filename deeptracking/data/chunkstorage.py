@@ -0,0 +1,223 @@
+"""
+    Packs rgb/depth frames in compressed chunks : chunk_size consecutive frames (see frame_record_dtype) are compressed
+    together with a codec of the registry (see framecodecs) and appended to a single data file.
+
+    Layout of a storage folder :
+        chunks.json     : frame shape and, for each chunk, its offset and length in chunks.bin, its codec and the
+                          ordered list of its frame ids
+        chunks.journal  : chunks appended since chunks.json was last saved, one json list per line
+        chunks.bin      : compressed chunks
+
+    Only complete chunks are written when the storage is flushed, the frames of the chunk being filled are written
+    when it is complete or when the index is saved (save_index).
+"""
+
+import json
+import os
+import numpy as np
+from collections import OrderedDict
+from deeptracking.data.shardstorage import frame_record_dtype, read_journal_lines, append_journal_lines
+from deeptracking.data.framecodecs import get_codec
+
+
+class ChunkStorage:
+    INDEX_FILE = "chunks.json"
+    JOURNAL_FILE = "chunks.journal"
+    DATA_FILE = "chunks.bin"
+    DEFAULT_CODEC = "zlib1"
+
+    # one storage per folder and per process
+    storages = {}
+
+    def __init__(self, path, codec=DEFAULT_CODEC, chunk_size=1, cached_chunks=2):
+        self.path = path
+        self.codec = codec
+        self.chunk_size = chunk_size
+        self.cached_chunks = cached_chunks
+        self.shape = None
+        self.dtype = None
+        # [offset, length, codec, ids] of each chunk
+        self.chunks = []
+        self.locations = {}
+        # records of the chunk being filled
+        self.pending = OrderedDict()
+        self.cache = OrderedDict()
+        self.writer = None
+        self.reader = None
+        self.dirty = False
+        # number of chunks saved in the index or the journal, and in the index only
+        self.saved_qty = 0
+        self.indexed_qty = 0
+        self.load_index()
+
+    @staticmethod
+    def open(path, codec=None, chunk_size=None):
+        """
+        Storage of a folder, if codec or chunk_size are given they are used for the next chunks. Reading a frame
+        decompresses its whole chunk : small chunks are faster to read in random order, large chunks compress better.
+        :param path:
+        :param codec:
+        :param chunk_size: frames per chunk
+        :return:
+        """
+        key = os.path.abspath(path)
+        if key not in ChunkStorage.storages:
+            ChunkStorage.storages[key] = ChunkStorage(path)
+        storage = ChunkStorage.storages[key]
+        if codec is not None:
+            get_codec(codec)
+            storage.codec = codec
+        if chunk_size is not None:
+            storage.chunk_size = chunk_size
+        return storage
+
+    @staticmethod
+    def close(path):
+        """
+        Forget the storage of a folder in this process (files are closed, pending frames are not written)
+        :param path:
+        :return:
+        """
+        storage = ChunkStorage.storages.pop(os.path.abspath(path), None)
+        if storage is not None:
+            if storage.writer is not None:
+                storage.writer.close()
+            if storage.reader is not None:
+                os.close(storage.reader)
+
+    def load_index(self):
+        index_path = os.path.join(self.path, self.INDEX_FILE)
+        if not os.path.exists(index_path):
+            return
+        with open(index_path) as data_file:
+            data = json.load(data_file)
+        self.set_shape(int(data["height"]), int(data["width"]))
+        self.chunks = data["chunks"] + [json.loads(line) for line in
+                                        read_journal_lines(os.path.join(self.path, self.JOURNAL_FILE))]
+        self.saved_qty = len(self.chunks)
+        self.indexed_qty = len(data["chunks"])
+        for chunk, (offset, length, codec, ids) in enumerate(self.chunks):
+            # a frame written again is in a later chunk
+            for position, id in enumerate(ids):
+                self.locations[id] = (chunk, position)
+
+    def save_index(self):
+        """
+        Write the frames of the chunk being filled, save the whole index and clear the journal
+        :return:
+        """
+        if self.pending:
+            self.write_chunk_()
+        # chunks flushed since the last save are only in the journal
+        if self.shape is None or (self.indexed_qty == len(self.chunks) and
+                                  os.path.exists(os.path.join(self.path, self.INDEX_FILE))):
+            return
+        self.write_index_()
+
+    def write_index_(self):
+        if self.writer is not None:
+            self.writer.flush()
+        data = {"height": self.shape[0], "width": self.shape[1], "chunks": self.chunks}
+        index_path = os.path.join(self.path, self.INDEX_FILE)
+        with open(index_path + ".tmp", 'w') as outfile:
+            json.dump(data, outfile)
+        os.replace(index_path + ".tmp", index_path)
+        open(os.path.join(self.path, self.JOURNAL_FILE), 'w').close()
+        self.saved_qty = len(self.chunks)
+        self.indexed_qty = len(self.chunks)
+        self.dirty = False
+
+    def flush(self):
+        """
+        Make the complete chunks written so far readable by other processes : only the new chunks are appended to the
+        journal (the first flush saves the index). The chunk being filled stays in memory, see saved.
+        :return:
+        """
+        if not self.dirty:
+            return
+        if not os.path.exists(os.path.join(self.path, self.INDEX_FILE)):
+            self.write_index_()
+            return
+        self.writer.flush()
+        append_journal_lines(os.path.join(self.path, self.JOURNAL_FILE),
+                             [json.dumps(chunk) for chunk in self.chunks[self.saved_qty:]])
+        self.saved_qty = len(self.chunks)
+        self.dirty = False
+
+    def set_shape(self, height, width):
+        self.shape = (height, width)
+        self.dtype = frame_record_dtype(height, width)
+
+    def __contains__(self, id):
+        return id in self.locations or id in self.pending
+
+    def saved(self, id):
+        """
+        :param id:
+        :return: True if the last frame written with this id is in a chunk of the index or the journal
+        """
+        return id in self.locations and id not in self.pending and self.locations[id][0] < self.saved_qty
+
+    def __len__(self):
+        return len(self.locations) + len([id for id in self.pending if id not in self.locations])
+
+    def write(self, id, rgb, depth):
+        if self.shape is None:
+            self.set_shape(*depth.shape[:2])
+        if depth.shape[:2] != self.shape:
+            raise ValueError("Frame {} has shape {}, storage {} only holds frames of shape {}".format(id, depth.shape,
+                                                                                                 self.path, self.shape))
+        record = np.empty((), dtype=self.dtype)
+        record["rgb"] = rgb
+        record["depth"] = depth
+        self.pending[id] = record
+        if len(self.pending) >= self.chunk_size:
+            self.write_chunk_()
+
+    def write_chunk_(self):
+        records = np.empty(len(self.pending), dtype=self.dtype)
+        for i, record in enumerate(self.pending.values()):
+            records[i] = record
+        compress, _ = get_codec(self.codec)
+        data = compress(records.tobytes())
+        if self.writer is None:
+            self.writer = open(os.path.join(self.path, self.DATA_FILE), 'ab')
+        offset = self.writer.tell()
+        self.writer.write(data)
+        ids = list(self.pending.keys())
+        chunk = len(self.chunks)
+        self.chunks.append([offset, len(data), self.codec, ids])
+        for position, id in enumerate(ids):
+            self.locations[id] = (chunk, position)
+        self.pending = OrderedDict()
+        self.dirty = True
+
+    def read(self, id):
+        """
+        Return copies of the rgb and depth of a frame, the decompressed chunks are kept in a small cache
+        :param id:
+        :return:
+        """
+        if id in self.pending:
+            record = self.pending[id]
+            return record["rgb"].copy(), record["depth"].copy()
+        chunk, position = self.locations[id]
+        records = self.load_chunk_(chunk)
+        return records["rgb"][position].copy(), records["depth"][position].copy()
+
+    def load_chunk_(self, chunk):
+        if chunk in self.cache:
+            self.cache.move_to_end(chunk)
+            return self.cache[chunk]
+        if self.writer is not None:
+            self.writer.flush()
+        if self.reader is None:
+            # pread does not use the file offset : the descriptor can be shared by forked processes
+            self.reader = os.open(os.path.join(self.path, self.DATA_FILE), os.O_RDONLY)
+        offset, length, codec, ids = self.chunks[chunk]
+        _, decompress = get_codec(codec)
+        records = np.frombuffer(decompress(os.pread(self.reader, length, offset)), dtype=self.dtype)
+        self.cache[chunk] = records
+        if len(self.cache) > self.cached_chunks:
+            self.cache.popitem(last=False)
+        return records
@@ -2,15 +2,19 @@ from deeptracking.data.dataset import Dataset
 from deeptracking.data.rgbd_dataset import RGBDDataset
 
 from scipy import ndimage
-from skimage.color import rgb2hsv, hsv2rgb
 from scipy.misc import imresize
 import numpy as np
-import scipy.signal
 import scipy.stats as st
-import random
+
+# dilation of color_blend applied to a stack of images : the default 2D structure, no dilation between the images
+BLEND_DILATION = np.zeros((3, 3, 3), dtype=bool)
+BLEND_DILATION[1] = ndimage.generate_binary_structure(2, 1)
 
 
 class DataAugmentation:
+    # 1D gaussian kernels of the blur, see gkern1d
+    gaussian_kernels = {}
+
     def __init__(self):
         self.occluder = None
         self.background = None
@@ -58,88 +62,171 @@ class DataAugmentation:
     def set_channel_hide(self, proba):
         self.channel_hide = proba
 
-    def augment(self, rgb, depth, prior, real=False):
+    def get_parameters(self):
+        """
+        Configuration of the augmentations (used to know if statistics computed on augmented data are still valid)
+        :return: json serializable dict
+        """
+        return {"occluder": self.occluder.path if self.occluder else None,
+                "background": self.background.path if self.background else None,
+                "rgb_noise": self.rgb_noise,
+                "depth_noise": self.depth_noise,
+                "blur_kernel": self.blur_kernel,
+                "jitter": self.jitter,
+                "hsv_noise": (self.h_noise, self.s_noise, self.v_noise),
+                "channel_hide": self.channel_hide}
+
+    def augment(self, rgb, depth, prior, real=False, rng=None):
+        """
+        Apply the random augmentations to a rgb/depth pair
+        :param rgb:
+        :param depth:
+        :param prior: pose of the object, used to place the occluder
+        :param real: if False only the jitter is applied
+        :param rng: np.random.RandomState used for every random draw (np.random if None)
+        :return:
+        """
+        if rng is None:
+            rng = np.random
         ret_rgb = rgb
         ret_depth = depth
 
         if real and self.occluder:
-            if random.uniform(0, 1) < 0.75:
-                rand_id = random.randint(0, self.occluder.size() - 1)
-                occluder_rgb, occluder_depth, occ_pose = self.occluder.load_image(rand_id)
-                if random.randint(0, 1):
-                    occluder_rgb, occluder_depth, _ = self.occluder.load_pair(rand_id, 0)
-                occluder_depth = occluder_depth.astype(np.float32)
-                # Z offset of occluder to be closer to the occluded object ( with random distance in front of the object)
-                offset = -occ_pose.matrix[2, 3] + prior.matrix[2, 3] - random.uniform(0.07, 0.01)
-                occluder_depth += offset
-
-                occluder_rgb = self.add_hsv_noise(occluder_rgb, 1, 0.1, 0.1)
-                occluder_rgb = imresize(occluder_rgb, ret_depth.shape, interp='nearest')
-                occluder_depth = imresize(occluder_depth, ret_depth.shape, interp='nearest', mode="F").astype(np.int16)
-                ret_rgb, ret_depth = self.depth_blend(ret_rgb, ret_depth, occluder_rgb, occluder_depth)
+            if rng.uniform(0, 1) < 0.75:
+                ret_rgb, ret_depth = self.add_occluder(ret_rgb, ret_depth, prior, rng)
 
         if real:
-            ret_rgb = self.add_hsv_noise(ret_rgb, self.h_noise, self.s_noise, self.v_noise, proba=0.5)
+            ret_rgb = self.add_hsv_noise(ret_rgb, self.h_noise, self.s_noise, self.v_noise, proba=0.5, rng=rng)
 
         if self.jitter:
-            self.x_jitter = random.randint(-self.jitter[0], self.jitter[0])
-            self.y_jitter = random.randint(-self.jitter[1], self.jitter[1])
-            if self.x_jitter > 0:
-                ret_rgb = np.pad(ret_rgb, ((self.x_jitter, 0), (0, 0), (0, 0)), mode='constant')[:-self.x_jitter, :, :]
-                ret_depth = np.pad(ret_depth, ((self.x_jitter, 0), (0, 0)), mode='constant')[:-self.x_jitter, :]
-            else:
-                ret_rgb = np.pad(ret_rgb, ((0, abs(self.x_jitter)), (0, 0), (0, 0)), mode='constant')[
-                          abs(self.x_jitter):, :, :]
-                ret_depth = np.pad(ret_depth, ((0, abs(self.x_jitter)), (0, 0)), mode='constant')[abs(self.x_jitter):,
-                            :]
-            if self.y_jitter > 0:
-                ret_rgb = np.pad(ret_rgb, ((0, 0), (self.y_jitter, 0), (0, 0)), mode='constant')[:, :-self.y_jitter, :]
-                ret_depth = np.pad(ret_depth, ((0, 0), (self.y_jitter, 0)), mode='constant')[:, :-self.y_jitter]
-            else:
-                ret_rgb = np.pad(ret_rgb, ((0, 0), (0, abs(self.y_jitter)), (0, 0)), mode='constant')[:,
-                          abs(self.y_jitter):, :]
-                ret_depth = np.pad(ret_depth, ((0, 0), (0, abs(self.y_jitter))), mode='constant')[:,
-                            abs(self.y_jitter):]
+            self.x_jitter = rng.randint(-self.jitter[0], self.jitter[0] + 1)
+            self.y_jitter = rng.randint(-self.jitter[1], self.jitter[1] + 1)
+            ret_rgb = self.shift_image(ret_rgb, self.x_jitter, self.y_jitter)
+            ret_depth = self.shift_image(ret_depth, self.x_jitter, self.y_jitter)
 
         if real and self.background:
-            color_background, depth_background = self.background.load_random_image(ret_rgb.shape[1])
+            color_background, depth_background = self.background.load_random_image(ret_rgb.shape[1], rng=rng)
             depth_background = depth_background.astype(np.int32)
             ret_rgb, ret_depth = self.color_blend(ret_rgb, ret_depth, color_background, depth_background)
 
         if real and self.rgb_noise:
-            if random.uniform(0, 1) > 0.05:
-                noise = random.uniform(0, self.rgb_noise)
-                ret_rgb = self.add_noise(ret_rgb, noise)
+            if rng.uniform(0, 1) > 0.05:
+                noise = rng.uniform(0, self.rgb_noise)
+                ret_rgb = self.add_noise(ret_rgb, noise, rng=rng)
         if real and self.depth_noise:
-            if random.uniform(0, 1) > 0.05:
-                noise = random.uniform(0, self.depth_noise)
-                ret_depth = self.add_noise(ret_depth, noise)
+            if rng.uniform(0, 1) > 0.05:
+                noise = rng.uniform(0, self.depth_noise)
+                ret_depth = self.add_noise(ret_depth, noise, rng=rng)
 
         if real and self.blur_kernel is not None:
-            if random.uniform(0, 1) < 0.4:
-                kernel_size = random.randint(3, self.blur_kernel)
-                kernel = self.gkern(kernel_size)
-                ret_rgb[:, :, 0] = scipy.signal.convolve2d(ret_rgb[:, :, 0], kernel, mode='same')
-                ret_rgb[:, :, 1] = scipy.signal.convolve2d(ret_rgb[:, :, 1], kernel, mode='same')
-                ret_rgb[:, :, 2] = scipy.signal.convolve2d(ret_rgb[:, :, 2], kernel, mode='same')
-            if random.uniform(0, 1) < 0.4:
-                kernel_size = random.randint(3, self.blur_kernel)
-                kernel = self.gkern(kernel_size)
-                ret_depth[:, :] = scipy.signal.convolve2d(ret_depth[:, :], kernel, mode='same')
+            if rng.uniform(0, 1) < 0.4:
+                kernel_size = rng.randint(3, self.blur_kernel + 1)
+                ret_rgb[:, :, :] = self.blur(ret_rgb, kernel_size)
+            if rng.uniform(0, 1) < 0.4:
+                kernel_size = rng.randint(3, self.blur_kernel + 1)
+                ret_depth[:, :] = self.blur(ret_depth, kernel_size)
 
         if real and self.channel_hide is not None:
-            if random.uniform(0, 1) < self.channel_hide:
-                if random.randint(0, 1):
+            if rng.uniform(0, 1) < self.channel_hide:
+                if rng.randint(0, 2):
                     ret_rgb[:, :, :] = 0
                 else:
                     ret_depth[:, :] = 0
         return ret_rgb, ret_depth
 
+    def augment_batch(self, rgb, depth, priors, real=False, rng=None):
+        """
+        Vectorized augment of a minibatch : the same random augmentations, the parameters of the samples are drawn as
+        arrays and the images are processed together in float32. The random draws differ from augment (same
+        distributions), the occluders and backgrounds are still loaded one sample at a time.
+        :param rgb: uint8 array (N, H, W, 3)
+        :param depth: array (N, H, W)
+        :param priors: pose of the object of each sample, used to place the occluders
+        :param real: if False only the jitter is applied
+        :param rng: np.random.RandomState used for every random draw (np.random if None)
+        :return: augmented rgb and depth, the inputs are not modified
+        """
+        if rng is None:
+            rng = np.random
+        qty = len(rgb)
+        ret_rgb = rgb.copy()
+        ret_depth = depth.copy()
+
+        if real and self.occluder:
+            for i in np.flatnonzero(rng.uniform(0, 1, qty) < 0.75):
+                ret_rgb[i], ret_depth[i] = self.add_occluder(ret_rgb[i], ret_depth[i], priors[i], rng)
+
+        if real:
+            ret_rgb = self.add_hsv_noise_batch(ret_rgb, self.h_noise, self.s_noise, self.v_noise, proba=0.5, rng=rng)
+
+        if self.jitter:
+            x_jitter = rng.randint(-self.jitter[0], self.jitter[0] + 1, qty)
+            y_jitter = rng.randint(-self.jitter[1], self.jitter[1] + 1, qty)
+            ret_rgb, ret_depth = self.jitter_batch(ret_rgb, ret_depth, x_jitter, y_jitter)
+
+        if real and self.background:
+            color_background = np.empty_like(ret_rgb)
+            depth_background = np.empty(ret_depth.shape, dtype=np.int32)
+            for i in range(qty):
+                color_background[i], depth_background[i] = self.background.load_random_image(ret_rgb.shape[2], rng=rng)
+            ret_rgb, ret_depth = self.color_blend_batch(ret_rgb, ret_depth, color_background, depth_background)
+
+        if real and self.rgb_noise:
+            self.add_noise_batch(ret_rgb, self.rgb_noise, rng=rng)
+        if real and self.depth_noise:
+            self.add_noise_batch(ret_depth, self.depth_noise, rng=rng)
+
+        if real and self.blur_kernel is not None:
+            self.blur_batch(ret_rgb, self.random_kernel_sizes_(qty, rng))
+            self.blur_batch(ret_depth, self.random_kernel_sizes_(qty, rng))
+
+        if real and self.channel_hide is not None:
+            hide = rng.uniform(0, 1, qty) < self.channel_hide
+            hide_rgb = rng.randint(0, 2, qty).astype(bool)
+            ret_rgb[hide & hide_rgb] = 0
+            ret_depth[hide & ~hide_rgb] = 0
+        return ret_rgb, ret_depth
+
+    def add_occluder(self, rgb, depth, prior, rng):
+        """
+        Blend a random occluder of the occluder dataset in front of the object
+        :param rgb:
+        :param depth:
+        :param prior: pose of the object
+        :param rng:
+        :return:
+        """
+        rand_id = rng.randint(0, self.occluder.size())
+        occluder_rgb, occluder_depth, occ_pose = self.occluder.load_image(rand_id)
+        if rng.randint(0, 2):
+            occluder_rgb, occluder_depth, _ = self.occluder.load_pair(rand_id, 0)
+        occluder_depth = occluder_depth.astype(np.float32)
+        # Z offset of occluder to be closer to the occluded object ( with random distance in front of the object)
+        offset = -occ_pose.matrix[2, 3] + prior.matrix[2, 3] - rng.uniform(0.07, 0.01)
+        occluder_depth += offset
+
+        occluder_rgb = self.add_hsv_noise(occluder_rgb, 1, 0.1, 0.1, rng=rng)
+        occluder_rgb = imresize(occluder_rgb, depth.shape, interp='nearest')
+        occluder_depth = imresize(occluder_depth, depth.shape, interp='nearest', mode="F").astype(np.int16)
+        return self.depth_blend(rgb, depth, occluder_rgb, occluder_depth)
+
+    def random_kernel_sizes_(self, qty, rng):
+        """
+        Blur kernel size of each sample, 0 for the samples that are not blurred
+        """
+        sizes = np.zeros(qty, dtype=int)
+        blurred = rng.uniform(0, 1, qty) < 0.4
+        if np.any(blurred):
+            sizes[blurred] = rng.randint(3, self.blur_kernel + 1, np.count_nonzero(blurred))
+        return sizes
+
     @staticmethod
-    def add_noise(img, gaussian_std):
+    def add_noise(img, gaussian_std, rng=None):
+        if rng is None:
+            rng = np.random
         type = img.dtype
         copy = img.astype(np.float)
-        gaussian_noise = np.random.normal(0, gaussian_std, img.shape)
+        gaussian_noise = rng.normal(0, gaussian_std, img.shape)
         copy = (gaussian_noise + copy)
         if type == np.uint8:
             copy[copy < 0] = 0
@@ -147,17 +234,222 @@ class DataAugmentation:
         return copy.astype(type)
 
     @staticmethod
-    def add_hsv_noise(rgb, hue_offset, saturation_offset, value_offset, proba=0.5):
-        mask = np.all(rgb != 0, axis=2)
-        hsv = rgb2hsv(rgb)
-        if random.uniform(0, 1) > proba:
-            hsv[:, :, 0] = (hsv[:, :, 0] + random.uniform(-hue_offset, hue_offset)) % 1
-        if random.uniform(0, 1) > proba-0.1:
-            hsv[:, :, 1] = (hsv[:, :, 1] + random.uniform(-saturation_offset, saturation_offset)) % 1
-        if random.uniform(0, 1) > proba-0.1:
-            hsv[:, :, 2] = (hsv[:, :, 2] + random.uniform(-value_offset, value_offset)) % 1
-        rgb = hsv2rgb(hsv) * 255
-        return rgb.astype(np.uint8) * mask[:, :, np.newaxis]
+    def add_hsv_noise(rgb, hue_offset, saturation_offset, value_offset, proba=0.5, rng=None):
+        if rng is None:
+            rng = np.random
+        offsets = np.zeros((1, 3), dtype=np.float32)
+        shifted = np.zeros((1, 3), dtype=bool)
+        if rng.uniform(0, 1) > proba:
+            offsets[0, 0] = rng.uniform(-hue_offset, hue_offset)
+            shifted[0, 0] = True
+        if rng.uniform(0, 1) > proba-0.1:
+            offsets[0, 1] = rng.uniform(-saturation_offset, saturation_offset)
+            shifted[0, 1] = True
+        if rng.uniform(0, 1) > proba-0.1:
+            offsets[0, 2] = rng.uniform(-value_offset, value_offset)
+            shifted[0, 2] = True
+        return DataAugmentation.shift_hsv(rgb[np.newaxis], offsets, shifted)[0]
+
+    @staticmethod
+    def add_noise_batch(images, max_gaussian_std, rng=None):
+        """
+        Add gaussian noise to 95% of the images, in place, the std of each image is uniform in [0, max_gaussian_std]
+        :param images: array (N, ...)
+        :param max_gaussian_std:
+        :param rng:
+        :return:
+        """
+        if rng is None:
+            rng = np.random
+        qty = len(images)
+        noisy = rng.uniform(0, 1, qty) > 0.05
+        gaussian_std = rng.uniform(0, max_gaussian_std, qty)[noisy].astype(np.float32)
+        if not np.any(noisy):
+            return images
+        gaussian_noise = rng.standard_normal((len(gaussian_std),) + images.shape[1:]).astype(np.float32)
+        gaussian_noise *= gaussian_std.reshape((-1,) + (1,) * (images.ndim - 1))
+        gaussian_noise += images[noisy]
+        if images.dtype == np.uint8:
+            np.clip(gaussian_noise, 0, 255, out=gaussian_noise)
+        images[noisy] = gaussian_noise
+        return images
+
+    @staticmethod
+    def add_hsv_noise_batch(rgb, hue_offset, saturation_offset, value_offset, proba=0.5, rng=None):
+        """
+        add_hsv_noise of a stack of images (N, H, W, 3), each image has its own offsets
+        """
+        if rng is None:
+            rng = np.random
+        qty = len(rgb)
+        offsets = np.stack((rng.uniform(-hue_offset, hue_offset, qty),
+                            rng.uniform(-saturation_offset, saturation_offset, qty),
+                            rng.uniform(-value_offset, value_offset, qty)), axis=1).astype(np.float32)
+        shifted = rng.uniform(0, 1, (qty, 3)) > np.array([proba, proba - 0.1, proba - 0.1])
+        return DataAugmentation.shift_hsv(rgb, offsets, shifted)
+
+    @staticmethod
+    def shift_hsv(rgb, offsets, shifted):
+        """
+        Add offsets to the hue, saturation and value of a stack of images, as in hsv space : only the shifted channels
+        are taken % 1 (a value or saturation of 1 becomes 0). Pixels with a channel at 0 become black.
+
+        The images are not converted to hsv : the value is the max channel, its 256 levels are shifted in a lookup
+        table (a uint8 table of every channel when only the value is shifted). The hue is computed and rotated in
+        float32 only in the images with a hue offset.
+        :param rgb: uint8 array (N, H, W, 3)
+        :param offsets: float array (N, 3), hue, saturation and value offsets of each image
+        :param shifted: bool array (N, 3), shifted channels of each image
+        :return: uint8 images
+        """
+        # (reductions along the 3 channels are slow in numpy, the channels are compared one by one)
+        mask = (np.minimum(np.minimum(rgb[..., 0], rgb[..., 1]), rgb[..., 2]) != 0)[..., np.newaxis]
+        ret = rgb * mask
+        maximum = np.maximum(np.maximum(ret[..., 0], ret[..., 1]), ret[..., 2])
+        for i in np.flatnonzero(np.all(shifted == (False, False, True), axis=1)):
+            table = DataAugmentation.value_table(offsets[i, 2])
+            ret[i] = table[maximum[i, :, :, np.newaxis], ret[i]]
+        colored = np.flatnonzero(np.any(shifted[:, :2], axis=1))
+        if len(colored):
+            ret[colored] = DataAugmentation.shift_hue_saturation_(ret[colored], maximum[colored], offsets[colored],
+                                                                  shifted[colored])
+            ret[colored] *= mask[colored]
+        return ret
+
+    @staticmethod
+    def value_levels(offsets, shifted):
+        """
+        :param offsets: value offset of each image
+        :param shifted: True if the value of the image is shifted
+        :return: float32 array (N, 256), max channel of each level after the value shift
+        """
+        shifted = np.asarray(shifted)
+        values = np.arange(256, dtype=np.float32) / 255 + (np.asarray(offsets) * shifted)[:, np.newaxis]
+        values[shifted] -= np.floor(values[shifted])
+        return values * 255
+
+    @staticmethod
+    def value_table(offset):
+        """
+        Lookup table of a value shift : the hue and saturation are kept, every channel is scaled as the max channel
+        :param offset: value offset
+        :return: uint8 array (256, 256), new level of a channel indexed by (max channel, channel)
+        """
+        levels = np.arange(256)
+        maximum = DataAugmentation.value_levels([offset], [True])[0].astype(np.float64)
+        return (levels * maximum[:, np.newaxis] / np.maximum(levels, 1)[:, np.newaxis]).astype(np.uint8)
+
+    @staticmethod
+    def shift_hue_saturation_(rgb, rgb_maximum, offsets, shifted):
+        channels = rgb.astype(np.float32)
+        maximum = rgb_maximum.astype(np.float32)[..., np.newaxis]
+        chroma = maximum - np.minimum(np.minimum(channels[..., 0:1], channels[..., 1:2]), channels[..., 2:3])
+        gray = chroma[..., 0] == 0
+        # position of each channel from the max (0) to the min (1) channel, the gray pixels have the hue 0 (red)
+        position = maximum - channels
+        position /= np.maximum(chroma, 1)
+        position[gray] = (0, 1, 1)
+        hue_shifted = np.flatnonzero(shifted[:, 0])
+        if len(hue_shifted):
+            position[hue_shifted] = DataAugmentation.rotate_hue_(position[hue_shifted], offsets[hue_shifted, 0])
+
+        saturation = chroma[..., 0] / np.maximum(maximum[..., 0], 1)
+        saturation_shifted = np.flatnonzero(shifted[:, 1])
+        saturation[saturation_shifted] += offsets[saturation_shifted, 1, np.newaxis, np.newaxis]
+        saturation[saturation_shifted] -= np.floor(saturation[saturation_shifted])
+
+        levels = DataAugmentation.value_levels(offsets[:, 2], shifted[:, 2])
+        maximum = levels[np.arange(len(rgb))[:, np.newaxis, np.newaxis], rgb_maximum]
+        position *= -saturation[..., np.newaxis]
+        position += 1
+        position *= maximum[..., np.newaxis]
+        return position.astype(np.uint8)
+
+    @staticmethod
+    def rotate_hue_(position, hue_offsets):
+        red, green, blue = position[..., 0], position[..., 1], position[..., 2]
+        # sextant of the max channel (position 0) as in skimage rgb2hsv, blue then green have priority on ties
+        hue = np.where(blue == 0, 4 + green - red, np.where(green == 0, 2 + red - blue, blue - green))
+        hue += hue_offsets[:, np.newaxis, np.newaxis] * 6
+        hue %= 6
+        rotated = np.empty(position.shape, dtype=np.float32)
+        for channel, offset in enumerate((5, 3, 1)):
+            k = (hue + offset) % 6
+            # as in skimage hsv2rgb, each channel moves to the min channel on its side of the hue circle
+            rotated[..., channel] = np.clip(np.minimum(k, 4 - k), 0, 1)
+        return rotated
+
+    @staticmethod
+    def jitter_batch(rgb, depth, x_jitter, y_jitter):
+        """
+        Translate each image of the stack by its jitter (rows, columns), pixels out of the image are 0
+        :param rgb: array (N, H, W, 3)
+        :param depth: array (N, H, W)
+        :param x_jitter: row offset of each image
+        :param y_jitter: column offset of each image
+        :return:
+        """
+        ret_rgb = np.empty_like(rgb)
+        ret_depth = np.empty_like(depth)
+        for i in range(len(depth)):
+            DataAugmentation.shift_image(rgb[i], x_jitter[i], y_jitter[i], out=ret_rgb[i])
+            DataAugmentation.shift_image(depth[i], x_jitter[i], y_jitter[i], out=ret_depth[i])
+        return ret_rgb, ret_depth
+
+    @staticmethod
+    def shift_image(image, x_offset, y_offset, out=None):
+        """
+        Translate the image by (rows, columns) with a single copy, the pixels out of the image are 0 (same result as
+        padding the image with zeros then cropping it)
+        :param image: array (H, W, ...)
+        :param x_offset: row offset
+        :param y_offset: column offset
+        :param out: output of the same shape as image, can not be image (new array if None)
+        :return: out
+        """
+        if out is None:
+            out = np.empty_like(image)
+        height, width = image.shape[:2]
+        x_offset = int(np.clip(x_offset, -height, height))
+        y_offset = int(np.clip(y_offset, -width, width))
+        # rows [top, bottom) and columns [left, right) of the output come from the image
+        top, bottom = max(x_offset, 0), height + min(x_offset, 0)
+        left, right = max(y_offset, 0), width + min(y_offset, 0)
+        out[top:bottom, left:right] = image[top - x_offset:bottom - x_offset, left - y_offset:right - y_offset]
+        out[:top] = 0
+        out[bottom:] = 0
+        out[top:bottom, :left] = 0
+        out[top:bottom, right:] = 0
+        return out
+
+    @staticmethod
+    def blur_batch(images, kernel_sizes):
+        """
+        Blur each image of the stack, in place, with the gaussian kernel of its size (see blur, 0 : not blurred)
+        :param images: array (N, H, W) or (N, H, W, C)
+        :param kernel_sizes: kernel size of each image
+        :return:
+        """
+        for kernel_size in np.unique(kernel_sizes[kernel_sizes > 0]):
+            blurred = kernel_sizes == kernel_size
+            images[blurred] = DataAugmentation.blur(images[blurred], kernel_size, axes=(1, 2))
+        return images
+
+    @staticmethod
+    def blur(images, kernel_size, axes=(0, 1)):
+        """
+        Gaussian blur of the images as a separable filter in float32 : same result as scipy.signal.convolve2d of each
+        channel with gkern(kernel_size) in 'same' mode
+        :param images:
+        :param kernel_size:
+        :param axes: rows and columns axes, the other axes (channels, images of a stack) are not mixed
+        :return: float32 blurred images
+        """
+        kernel = DataAugmentation.gkern1d(kernel_size)
+        # same alignment as convolve2d(mode='same') for the even sizes
+        origin = kernel_size % 2 - 1
+        blurred = ndimage.convolve1d(images, kernel, axis=axes[0], output=np.float32, mode='constant', origin=origin)
+        return ndimage.convolve1d(blurred, kernel, axis=axes[1], output=np.float32, mode='constant', origin=origin)
 
     @staticmethod
     def color_blend(rgb1, depth1, rgb2, depth2):
@@ -170,6 +462,17 @@ class DataAugmentation:
         new_color = rgb2 * mask[:, :, np.newaxis] + rgb1
         return new_color.astype(np.uint8), new_depth
 
+    @staticmethod
+    def color_blend_batch(rgb1, depth1, rgb2, depth2):
+        """
+        color_blend of stacks of images (N, H, W, 3) and (N, H, W)
+        """
+        mask = np.all(rgb1 == 0, axis=3)
+        mask = ndimage.binary_dilation(mask, structure=BLEND_DILATION)
+        new_depth = np.where(mask, depth2, depth1)
+        new_color = np.where(mask[:, :, :, np.newaxis], rgb2, rgb1)
+        return new_color.astype(np.uint8), new_depth
+
     @staticmethod
     def depth_blend(rgb1, depth1, rgb2, depth2):
 
@@ -209,3 +512,14 @@ class DataAugmentation:
         kernel_raw = np.sqrt(np.outer(kern1d, kern1d))
         kernel = kernel_raw / kernel_raw.sum()
         return kernel
+
+    @staticmethod
+    def gkern1d(kernlen=21, nsig=2):
+        """Returns the 1D factor of gkern (float32) : gkern is its outer product with itself. Cached per size."""
+        key = (kernlen, nsig)
+        if key not in DataAugmentation.gaussian_kernels:
+            interval = (2 * nsig + 1.) / (kernlen)
+            x = np.linspace(-nsig - interval / 2., nsig + interval / 2., kernlen + 1)
+            kern1d = np.sqrt(np.diff(st.norm.cdf(x)))
+            DataAugmentation.gaussian_kernels[key] = (kern1d / kern1d.sum()).astype(np.float32)
+        return DataAugmentation.gaussian_kernels[key]
@@ -2,125 +2,288 @@ import os
 import numpy as np
 import json
 import math
+import time
+import hashlib
+import threading
 
 from deeptracking.data.parallelminibatch import ParallelMinibatch
-from deeptracking.data.dataset_utils import normalize_channels, normalize_depth
-from deeptracking.utils.transform import Transform
+from deeptracking.data.dataset_utils import normalize_channels, normalize_depth, normalize_channels_batch, \
+    normalize_depth_batch, RunningStatistics
 from deeptracking.utils.camera import Camera
-from deeptracking.data.frame import Frame, FrameNumpy
+from deeptracking.data.frame import Frame, FrameNumpy, FrameShard, FrameChunk
+from deeptracking.data.chunkstorage import ChunkStorage
+from deeptracking.data.poseindex import PoseIndex, PoseJournal
+from deeptracking.data.samplecache import SampleCache
+from deeptracking.data.asyncwriter import AsyncWriter
+from collections import deque
+from collections.abc import Mapping
 
 
 class Dataset(ParallelMinibatch):
-    def __init__(self, folder_path, frame_class="png", minibatch_size=64, max_parallel_buffer_size=0, max_samples=0):
-        ParallelMinibatch.__init__(self, max_parallel_buffer_size)
+    STATISTICS_FILE = "mean_std.json"
+
+    def __init__(self, folder_path, frame_class="png", minibatch_size=64, max_parallel_buffer_size=0, max_samples=0,
+                 shared_memory=False, ordered=False, seed=None, process_qty=0, max_memory=0, stream=0):
+        ParallelMinibatch.__init__(self, max_parallel_buffer_size, shared_memory, ordered, seed, process_qty,
+                                   max_memory, stream)
         self.path = folder_path
-        self.data_pose = []
-        self.data_pair = {}
+        self.index = PoseIndex()
+        self.journal = PoseJournal(folder_path)
+        # dumped samples whose poses are not journaled yet, in dump order : [frame ids, pose records, frames written]
+        self.unjournaled = deque()
+        self.unjournaled_lock = threading.Lock()
+        # frames which images are still in ram (not dumped yet)
+        self.frames = {}
+        self.pair_frames = {}
         self.metadata = {}
         self.camera = None
         self.frame_class = None
+        self.writer = None
         self.set_save_type(frame_class)
         self.mean = None
         self.std = None
         self.data_augmentation = None
+        self.sample_cache = None
         self.minibatch_size = minibatch_size
         self.max_size = max_samples
 
     def set_save_type(self, frame_class):
         if frame_class == "numpy":
             self.frame_class = FrameNumpy
+        elif frame_class == "shard":
+            self.frame_class = FrameShard
+        elif frame_class.startswith("chunk"):
+            # "chunk", "chunk:codec" or "chunk:codec:frames per chunk" (see framecodecs and ChunkStorage)
+            self.frame_class = FrameChunk
+            options = frame_class.split(":")[1:]
+            codec = options[0] if len(options) > 0 else None
+            chunk_size = int(options[1]) if len(options) > 1 else None
+            ChunkStorage.open(self.path, codec, chunk_size)
         else:
             self.frame_class = Frame
+        if self.writer is not None:
+            self.writer.frame_class = self.frame_class
+
+    def set_async_writer(self, worker_qty=4, max_pending=64):
+        """
+        dump_images_on_disk hands the frames to a background writer (see AsyncWriter) instead of writing them, at most
+        max_pending samples wait to be written (dump_images_on_disk blocks after). Dumped frames can be read once
+        flush_writes (or save_json_files, close) returns, by other processes once save_json_files returns for the
+        frames of a chunk being filled.
+        :param worker_qty: number of writing processes
+        :param max_pending:
+        :return:
+        """
+        self.close()
+        self.writer = AsyncWriter(self.path, self.frame_class, worker_qty, max_pending)
+
+    def flush_writes(self):
+        """
+        Wait until all dumped frames are written and the poses of the samples on disk are journaled (the frames of
+        a chunk being filled are written by save_json_files)
+        :return:
+        """
+        if self.writer is not None:
+            self.writer.flush()
 
-    def compute_mean_std(self):
-        max_size = 10000
-        indexes = self.compute_minibatches_permutations_()[:int(max_size/self.minibatch_size)]
-        self.mean = self.compute_channels_mean(indexes)
-        self.std = self.compute_channels_std(indexes, self.mean)
+    def close(self):
+        """
+        Write the frames still in the background writer and stop it
+        :return:
+        """
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+    def compute_mean_std(self, max_samples=10000):
+        """
+        Compute the mean and std of the 8 channels on a random subset of the (augmented) samples, in one pass over the
+        worker pool. The std is the std of the per image channel means. Results are saved next to the dataset with the
+        key of statistics_key, see load_mean_std.
+        :param max_samples:
+        :return:
+        """
+        indexes = self.compute_minibatches_permutations_()[:int(max_samples/self.minibatch_size)]
+        statistics = RunningStatistics(8)
+        self.mean = None
+        self.std = None
+        self.init_processes(indexes)
+        try:
+            for image_buffer, _, _ in self.get_minibatch():
+                statistics.update(np.mean(image_buffer, axis=(2, 3)))
+        finally:
+            self.stop_processes()
+        self.mean = statistics.mean
+        self.std = statistics.std()
         np.save(os.path.join(self.path, "mean.npy"), self.mean)
         np.save(os.path.join(self.path, "std.npy"), self.std)
+        with open(os.path.join(self.path, self.STATISTICS_FILE), 'w') as outfile:
+            json.dump({"key": self.statistics_key(max_samples), "sample_qty": statistics.count}, outfile)
 
-    def compute_channels_mean(self, batch_indexes):
-        # todo could be done in parallel
-        channel_means = np.zeros(8)
-        processed_images = 0
-        for index in batch_indexes:
-            image_buffer, _, _ = self.load_minibatch(index)
-            image_means = np.mean(image_buffer, axis=(2, 3))
-            channel_means += np.sum(image_means, axis=0)
-            processed_images += image_buffer.shape[0]
-        channel_means = channel_means / processed_images
-        return channel_means
-
-    def compute_channels_std(self, batch_indexes, channel_mean):
-        channel_std = np.zeros(8)
-        processed_images = 0
-        for index in batch_indexes:
-            image_buffer, _, _ = self.load_minibatch(index)
-            image_means = np.mean(image_buffer, axis=(2, 3))
-            channel_std += np.sum(np.square(image_means - channel_mean), axis=0)
-            processed_images += image_buffer.shape[0]
-        channel_std = np.sqrt(channel_std / processed_images)
-        return channel_std
+    def load_mean_std(self, max_samples=10000):
+        """
+        Load the mean and std saved by compute_mean_std if they were computed with the same dataset content, data
+        augmentation and max_samples
+        :param max_samples:
+        :return: True if the saved statistics are valid and loaded
+        """
+        statistics_path = os.path.join(self.path, self.STATISTICS_FILE)
+        if not os.path.exists(statistics_path):
+            return False
+        with open(statistics_path) as data_file:
+            data = json.load(data_file)
+        if data.get("key") != self.statistics_key(max_samples):
+            return False
+        self.mean = np.load(os.path.join(self.path, "mean.npy"))
+        self.std = np.load(os.path.join(self.path, "std.npy"))
+        return True
+
+    def statistics_key(self, max_samples):
+        """
+        Hash of what the channel statistics depend on : the pose index file, the metadata, the data augmentation
+        parameters and the number of samples
+        :param max_samples:
+        :return:
+        """
+        key = hashlib.sha1()
+        index_file = PoseIndex.FILE if PoseIndex.exists(self.path) else "viewpoints.json"
+        with open(os.path.join(self.path, index_file), 'rb') as data_file:
+            for block in iter(lambda: data_file.read(1 << 20), b""):
+                key.update(block)
+        augmentation = self.data_augmentation.get_parameters() if self.data_augmentation is not None else None
+        key.update(json.dumps([self.metadata, augmentation, max_samples], sort_keys=True).encode())
+        return key.hexdigest()
 
     def add_pose(self, rgb, depth, pose):
-        index = self.size()
-        frame = self.frame_class(rgb, depth, str(index))
-        self.data_pose.append((frame, pose))
+        index = self.index.add_pose(pose.to_parameters())
+        if rgb is not None:
+            self.frames[index] = self.frame_class(rgb, depth, str(index))
         return index
 
     def pair_size(self, id):
-        if id not in self.data_pair:
-            return 0
-        else:
-            return len(self.data_pair[id])
+        return self.index.pair_size(id)
 
     def add_pair(self, rgb, depth, pose, id):
-        if id >= len(self.data_pose):
+        if id >= self.size():
             raise IndexError("impossible to add pair if pose does not exists")
-        if id in self.data_pair:
-            frame = self.frame_class(rgb, depth, "{}n{}".format(id, len(self.data_pair[id]) - 1))
-            self.data_pair[id].append((frame, pose))
-        else:
-            frame = self.frame_class(rgb, depth, "{}n0".format(id))
-            self.data_pair[id] = [(frame, pose)]
+        pair_id = self.index.add_pair(id, pose.to_parameters())
+        if rgb is not None:
+            self.pair_frames.setdefault(id, {})[pair_id] = self.frame_class(rgb, depth, "{}n{}".format(id, pair_id))
+
+    def get_frame(self, index):
+        """
+        Frames only live in the dataset while their images are in ram, else a frame pointing to the disk is returned
+        :param index:
+        :return:
+        """
+        if index in self.frames:
+            return self.frames[index]
+        return self.frame_class(None, None, str(index))
+
+    def get_pair_frame(self, index, pair_id):
+        if index in self.pair_frames and pair_id in self.pair_frames[index]:
+            return self.pair_frames[index][pair_id]
+        return self.frame_class(None, None, "{}n{}".format(index, pair_id))
+
+    @property
+    def data_pose(self):
+        return PoseSequence(self)
+
+    @property
+    def data_pair(self):
+        return PairMapping(self)
 
     def dump_images_on_disk(self, verbose=False):
         """
         Unload all images data from ram and save them to the dataset's path ( can be reloaded with load_from_disk())
         :return:
         """
+        indexes = sorted(set(self.frames) | set(self.pair_frames))
         if verbose:
-            print("Save {} viewpoints".format(len(self.data_pose)))
-        for frame, pose in self.data_pose:
+            print("Save {} viewpoints".format(len(indexes)))
+        for index in indexes:
             if verbose:
-                print("Save frame {}".format(frame.id))
-            if int(frame.id) in self.data_pair:
-                for pair_frame, pair_pose in self.data_pair[int(frame.id)]:
-                    pair_frame.dump(self.path)
-            frame.dump(self.path)
+                print("Save frame {}".format(index))
+            frames = list(self.pair_frames.pop(index, {}).values())
+            if index in self.frames:
+                frames.append(self.frames.pop(index))
+            sample = self.add_unjournaled_([frame.id for frame in frames], self.index.sample_records(index))
+            if self.writer is not None:
+                self.writer.submit(frames, lambda sample=sample: self.journal_written_(sample))
+            else:
+                for frame in frames:
+                    frame.dump(self.path)
+                self.frame_class.flush(self.path)
+                self.journal_written_(sample)
+
+    def add_unjournaled_(self, ids, records):
+        sample = [ids, records, False]
+        with self.unjournaled_lock:
+            self.unjournaled.append(sample)
+        return sample
+
+    def journal_written_(self, sample):
+        """
+        Mark the frames of a sample as written, then journal the poses of the samples on disk, in dump order : a
+        sample is journaled once its frames are written and flushed by the frame class (see Frame.saved)
+        :param sample: returned by add_unjournaled_
+        :return:
+        """
+        with self.unjournaled_lock:
+            sample[2] = True
+            while self.unjournaled and self.unjournaled[0][2] and \
+                    self.frame_class.saved(self.path, self.unjournaled[0][0]):
+                self.journal.append(self.unjournaled.popleft()[1])
+
+    def append_dataset(self, dataset, start=0):
+        """
+        Move the samples of another dataset (with the same save type) at the end of this dataset, starting at its
+        sample start. Frame files are renamed, frames of shard and chunk storages are copied. Moved samples are
+        journaled as dumped samples are : an interrupted append can be continued from start = size() - first index.
+        :param dataset:
+        :param start:
+        :return: number of samples moved
+        """
+        if dataset.frame_class is not self.frame_class:
+            raise Exception("Dataset {} save type differs from dataset {}".format(dataset.path, self.path))
+        self.flush_writes()
+        for i in range(start, dataset.size()):
+            index = self.index.add_pose(dataset.index.pose_parameters(i))
+            ids = [str(index)]
+            dataset.get_frame(i).move(dataset.path, self.path, ids[0])
+            for pair_id in range(dataset.pair_size(i)):
+                self.index.add_pair(index, dataset.index.pair_parameters(i, pair_id))
+                ids.append("{}n{}".format(index, pair_id))
+                dataset.get_pair_frame(i, pair_id).move(dataset.path, self.path, ids[-1])
+            self.frame_class.flush(self.path)
+            self.journal_written_(self.add_unjournaled_(ids, self.index.sample_records(index)))
+        return max(dataset.size() - start, 0)
 
     def save_json_files(self, metadata):
-        viewpoints_data = {}
-        for frame, pose in self.data_pose:
-            self.insert_pose_in_dict(viewpoints_data, frame.id, pose)
-            if int(frame.id) in self.data_pair:
-                viewpoints_data[frame.id]["pairs"] = len(self.data_pair[int(frame.id)])
-                for pair_frame, pair_pose in self.data_pair[int(frame.id)]:
-                    self.insert_pose_in_dict(viewpoints_data, pair_frame.id, pair_pose)
-            else:
-                viewpoints_data[frame.id]["pairs"] = 0
-        viewpoints_data["metaData"] = metadata
-        with open(os.path.join(self.path, "viewpoints.json"), 'w') as outfile:
-            json.dump(viewpoints_data, outfile)
+        """
+        Save the poses in viewpoints.npz and the metadata in viewpoints.json (once the dumped frames are written), the
+        journal of the samples dumped since the last save is then cleared. Files are replaced atomically.
+        :param metadata:
+        :return:
+        """
+        self.flush_writes()
         if self.camera is None:
             raise Exception("Camera is not defined for dataset...")
         self.camera.save(self.path)
+        self.frame_class.compact(self.path)
+        self.index.save(self.path)
+        json_path = os.path.join(self.path, "viewpoints.json")
+        with open(json_path + ".tmp", 'w') as outfile:
+            json.dump({"metaData": metadata}, outfile)
+        os.replace(json_path + ".tmp", json_path)
+        # the saved index holds every sample
+        with self.unjournaled_lock:
+            self.unjournaled.clear()
+        self.journal.clear()
 
     def load(self):
         """
-        Load a viewpoints.json to dataset's structure
-        Todo: datastructure should be more similar to json structure...
+        Load viewpoints.npz (or the legacy viewpoints.json poses) to dataset's structure
         :return: return false if the dataset is empty.
         """
         # Load viewpoints file and camera file
@@ -132,61 +295,81 @@ class Dataset(ParallelMinibatch):
             return False
         self.metadata = data["metaData"]
         self.set_save_type(self.metadata["save_type"])
-        count = 0
-        # todo this is not clean!i
-        while True:
-            try:
-                id = str(count)
-                pose = Transform.from_parameters(*[float(data[id]["vector"][str(x)]) for x in range(6)])
-                self.add_pose(None, None, pose)
-                if "pairs" in data[id]:
-                    for i in range(int(data[id]["pairs"])):
-                        pair_id = "{}n{}".format(id, i)
-                        pair_pose = Transform.from_parameters(*[float(data[pair_id]["vector"][str(x)]) for x in range(6)])
-                        self.add_pair(None, None, pair_pose, count)
-                count += 1
-
-            except KeyError:
-                print("Keyerror {} at {}".format(id, count))
-                break
+        if PoseIndex.exists(self.path):
+            self.index = PoseIndex.load(self.path)
+        else:
+            self.index = PoseIndex.from_json(data)
+        # samples written after the last save (interrupted generation)
+        self.index.replay(PoseJournal.read(self.path))
+        self.frames = {}
+        self.pair_frames = {}
         return True
 
-    @staticmethod
-    def insert_pose_in_dict(dict, key, item):
-        params = {}
-        for i, param in enumerate(item.to_parameters()):
-            params[str(i)] = str(param)
-        dict[key] = {"vector": params}
-
     def size(self):
-        return len(self.data_pose)
+        return self.index.size()
 
     def set_data_augmentation(self, data_augmentation):
         self.data_augmentation = data_augmentation
 
-    def get_image_pair(self, index):
-        frame, pose = self.data_pose[index]
-        frame_pair, pose_pair = self.data_pair[index][0]
+    def set_sample_cache(self, max_bytes):
+        """
+        Keep up to max_bytes of decoded frames in a shared memory LRU cache. Has to be called once the dataset is
+        loaded and before the workers are started, so they all share the cache.
+        :param max_bytes:
+        :return:
+        """
+        if self.processes:
+            raise Exception("set_sample_cache is called but the workers are already started!")
+        image_size = int(self.metadata["image_size"])
+        # key of a viewpoint is its index, key of a pair is size() + its row in the pose index
+        self.sample_cache = SampleCache(max_bytes, self.size() + self.index.pair_qty, image_size, image_size)
+
+    def get_rgb_depth_(self, frame, key):
+        if self.sample_cache is None:
+            return frame.get_rgb_depth(self.path)
+        cached = self.sample_cache.get(key)
+        if cached is not None:
+            rgb, depth = cached
+            return rgb, depth.view(frame.depth_dtype)
         rgb, depth = frame.get_rgb_depth(self.path)
-        rgb_pair, depth_pair = frame_pair.get_rgb_depth(self.path)
+        self.sample_cache.put(key, rgb, depth)
+        return rgb, depth
+
+    def get_image_pair(self, index):
+        rgb, depth, pose = self.load_image(index)
+        rgb_pair, depth_pair, _ = self.load_pair(index, 0)
         return rgb, depth, pose, rgb_pair, depth_pair
 
     def load_image(self, index):
-        frame, pose = self.data_pose[index]
-        rgb, depth = frame.get_rgb_depth(self.path)
-        return rgb, depth, pose
+        rgb, depth = self.get_rgb_depth_(self.get_frame(index), index)
+        return rgb, depth, self.index.pose(index)
 
     def load_pair(self, index, pair_id):
-        frame, pose = self.data_pair[index][pair_id]
-        rgb, depth = frame.get_rgb_depth(self.path)
+        pose = self.index.pair(index, pair_id)
+        key = self.size() + int(self.index.pair_row_(index, pair_id))
+        rgb, depth = self.get_rgb_depth_(self.get_pair_frame(index, pair_id), key)
         return rgb, depth, pose
 
-    def get_sample(self, index, image_buffer, prior_buffer, label_buffer, buffer_index):
+    def load_sample(self, index, rng=None):
+        """
+        Load and augment a viewpoint and its first pair
+        :param index:
+        :param rng:
+        :return: rgbA, depthA, rgbB, depthB, initial_pose, transformed_pose
+        """
+        start_time = time.time()
         rgbA, depthA, initial_pose = self.load_image(index)
         rgbB, depthB, transformed_pose = self.load_pair(index, 0)
+        start_time = self.add_timing_("load", start_time)
         if self.data_augmentation is not None:
-            rgbA, depthA = self.data_augmentation.augment(rgbA, depthA, initial_pose, real=False)
-            rgbB, depthB = self.data_augmentation.augment(rgbB, depthB, initial_pose, real=True)
+            rgbA, depthA = self.data_augmentation.augment(rgbA, depthA, initial_pose, real=False, rng=rng)
+            rgbB, depthB = self.data_augmentation.augment(rgbB, depthB, initial_pose, real=True, rng=rng)
+        self.add_timing_("augment", start_time)
+        return rgbA, depthA, rgbB, depthB, initial_pose, transformed_pose
+
+    def get_sample(self, index, image_buffer, prior_buffer, label_buffer, buffer_index, rng=None):
+        rgbA, depthA, rgbB, depthB, initial_pose, transformed_pose = self.load_sample(index, rng)
+        start_time = time.time()
 
         depthA = normalize_depth(depthA, initial_pose)
         depthB = normalize_depth(depthB, initial_pose)
@@ -209,6 +392,56 @@ class Dataset(ParallelMinibatch):
         image_buffer[buffer_index, 7, :, :] = depthB
         prior_buffer[buffer_index] = initial_pose.to_parameters(isQuaternion=True)
         label_buffer[buffer_index] = self.normalize_label(transformed_pose.to_parameters())
+        self.add_timing_("normalize", start_time)
+
+    def get_samples(self, indexes, image_buffer, prior_buffer, label_buffer, rng=None):
+        """
+        Batched version of get_sample : the raw crops of the minibatch are stacked, then data augmentation (see
+        DataAugmentation.augment_batch), depth normalization, mean/std scaling and the transpose to the buffer layout
+        are done once for the whole minibatch
+        :param indexes:
+        :param image_buffer:
+        :param prior_buffer:
+        :param label_buffer:
+        :param rng:
+        :return:
+        """
+        start_time = time.time()
+        image_size = image_buffer.shape[-1]
+        rgb = np.empty((2, len(indexes), image_size, image_size, 3), dtype=np.uint8)
+        depth = None
+        z = np.empty(len(indexes), dtype=np.float32)
+        initial_poses = []
+        for buffer_index, index in enumerate(indexes):
+            rgbA, depthA, initial_pose = self.load_image(index)
+            rgbB, depthB, transformed_pose = self.load_pair(index, 0)
+            if depth is None:
+                depth = np.empty((2, len(indexes), image_size, image_size), dtype=depthA.dtype)
+            rgb[0, buffer_index] = rgbA
+            rgb[1, buffer_index] = rgbB
+            depth[0, buffer_index] = depthA
+            depth[1, buffer_index] = depthB
+            z[buffer_index] = initial_pose.matrix[2, 3]
+            initial_poses.append(initial_pose)
+            prior_buffer[buffer_index] = initial_pose.to_parameters(isQuaternion=True)
+            label_buffer[buffer_index] = self.normalize_label(transformed_pose.to_parameters())
+        start_time = self.add_timing_("load", start_time)
+        rgbA, depthA, rgbB, depthB = rgb[0], depth[0], rgb[1], depth[1]
+        if self.data_augmentation is not None:
+            rgbA, depthA = self.data_augmentation.augment_batch(rgbA, depthA, initial_poses, real=False, rng=rng)
+            rgbB, depthB = self.data_augmentation.augment_batch(rgbB, depthB, initial_poses, real=True, rng=rng)
+        start_time = self.add_timing_("augment", start_time)
+
+        depthA = normalize_depth_batch(depthA.astype(np.float32), z)
+        depthB = normalize_depth_batch(depthB.astype(np.float32), z)
+        # buffer layout is (channel, x, y) : same as the .T of a (y, x, channel) image
+        image_buffer[:, 0:3] = rgbA.transpose(0, 3, 2, 1)
+        image_buffer[:, 3] = depthA.transpose(0, 2, 1)
+        image_buffer[:, 4:7] = rgbB.transpose(0, 3, 2, 1)
+        image_buffer[:, 7] = depthB.transpose(0, 2, 1)
+        if self.mean is not None and self.std is not None:
+            normalize_channels_batch(image_buffer, self.mean, self.std)
+        self.add_timing_("normalize", start_time)
 
     def get_batch_qty(self):
         return math.ceil(self.size() / self.minibatch_size)
@@ -222,19 +455,80 @@ class Dataset(ParallelMinibatch):
         PARALLEL MINIBATCH METHODS
     """
     def compute_minibatches_permutations_(self):
-        permutations = np.random.permutation(np.arange(0, self.size()))
+        permutations = self.epoch_random_state_().permutation(np.arange(0, self.size()))
         if self.max_size != 0:
             size = min(self.size(), self.max_size)
             permutations = permutations[:size]
         return [permutations[x:x + self.minibatch_size] for x in range(0, len(permutations), self.minibatch_size)]
 
-    def load_minibatch(self, task):
+    def minibatch_buffers_(self):
+        image_size = int(self.metadata["image_size"])
+        return [((self.minibatch_size, 8, image_size, image_size), np.float32),
+                ((self.minibatch_size, 7), np.float32),
+                ((self.minibatch_size, 6), np.float32)]
+
+    def epoch_state_(self):
+        return self.mean, self.std
+
+    def set_epoch_state_(self, state):
+        self.mean, self.std = state
+
+    def load_minibatch(self, task, buffers=None, rng=None):
         try:
-            image_buffer = np.ndarray((len(task), 8, int(self.metadata["image_size"]), int(self.metadata["image_size"])), dtype=np.float32)
-            prior_buffer = np.ndarray((len(task), 7), dtype=np.float32)
-            label_buffer = np.ndarray((len(task), 6), dtype=np.float32)
-            for buffer_index, permutation in enumerate(task):
-                self.get_sample(permutation, image_buffer, prior_buffer, label_buffer, buffer_index)
+            if buffers is None:
+                image_buffer = np.ndarray((len(task), 8, int(self.metadata["image_size"]), int(self.metadata["image_size"])), dtype=np.float32)
+                prior_buffer = np.ndarray((len(task), 7), dtype=np.float32)
+                label_buffer = np.ndarray((len(task), 6), dtype=np.float32)
+            else:
+                image_buffer, prior_buffer, label_buffer = buffers
+            self.get_samples(task, image_buffer, prior_buffer, label_buffer, rng)
         except Exception as e:
             print("Thread error : {}".format(e))
         return image_buffer, prior_buffer, label_buffer
+
+
+class PoseSequence:
+    """
+    List like view of the viewpoints as (frame, pose) tuples, poses are built when accessed
+    """
+    def __init__(self, dataset):
+        self.dataset = dataset
+
+    def __len__(self):
+        return self.dataset.size()
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        return self.dataset.get_frame(index), self.dataset.index.pose(index)
+
+    def __setitem__(self, index, item):
+        frame, pose = item
+        self.dataset.index.set_pose(index, pose.to_parameters())
+        if not frame.is_on_disk():
+            self.dataset.frames[index] = frame
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+class PairMapping(Mapping):
+    """
+    Dict like view of the pairs : viewpoint index -> list of (frame, pose) tuples
+    """
+    def __init__(self, dataset):
+        self.dataset = dataset
+
+    def __getitem__(self, index):
+        pair_qty = self.dataset.pair_size(index)
+        if pair_qty == 0:
+            raise KeyError(index)
+        return [(self.dataset.get_pair_frame(index, i), self.dataset.index.pair(index, i)) for i in range(pair_qty)]
+
+    def __iter__(self):
+        for index in np.flatnonzero(self.dataset.index.pair_counts[:self.dataset.size()]):
+            yield int(index)
+
+    def __len__(self):
+        return int(np.count_nonzero(self.dataset.index.pair_counts[:self.dataset.size()]))
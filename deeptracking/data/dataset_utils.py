@@ -231,4 +231,68 @@ def normalize_depth(depth, pose):
     zero_mask = depth == 0
     depth += pose.matrix[2, 3] * 1000
     depth[zero_mask] = 5000
-    return depth
\ No newline at end of file
+    return depth
+
+
+def normalize_depth_batch(depth, z):
+    """
+    Vectorized normalize_depth of a stack of depth images, in place
+    :param depth: float32 array (N, ..., H, W)
+    :param z: z translation (in meters) of the pose of each image, shape (N,)
+    :return:
+    """
+    zero_mask = depth == 0
+    depth += (np.asarray(z, dtype=np.float32) * 1000).reshape((-1,) + (1,) * (depth.ndim - 1))
+    depth[zero_mask] = 5000
+    return depth
+
+
+def normalize_channels_batch(image_buffer, mean, std):
+    """
+    Vectorized normalize_channels of a minibatch image buffer (N, C, W, H), in place
+    :param image_buffer:
+    :param mean: mean of each of the C channels
+    :param std: std of each of the C channels
+    :return:
+    """
+    image_buffer -= np.asarray(mean, dtype=np.float32)[np.newaxis, :, np.newaxis, np.newaxis]
+    image_buffer /= np.asarray(std, dtype=np.float32)[np.newaxis, :, np.newaxis, np.newaxis]
+    return image_buffer
+
+
+class RunningStatistics:
+    """
+    Mean and (population) variance of vectors accumulated one batch at a time. Two partial results are merged with
+    the parallel variant of Welford's algorithm (Chan et al.), so batches can be processed in any order in one pass.
+    """
+    def __init__(self, size):
+        self.count = 0
+        self.mean = np.zeros(size)
+        self.m2 = np.zeros(size)
+
+    def update(self, samples):
+        """
+        Add a batch of vectors
+        :param samples: array (N, size)
+        :return:
+        """
+        samples = np.asarray(samples, dtype=np.float64)
+        if len(samples) == 0:
+            return
+        mean = np.mean(samples, axis=0)
+        self.merge_(len(samples), mean, np.sum(np.square(samples - mean), axis=0))
+
+    def merge(self, other):
+        self.merge_(other.count, other.mean, other.m2)
+
+    def merge_(self, count, mean, m2):
+        if count == 0:
+            return
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean = self.mean + delta * count / total
+        self.m2 = self.m2 + m2 + np.square(delta) * self.count * count / total
+        self.count = total
+
+    def std(self):
+        return np.sqrt(self.m2 / self.count)
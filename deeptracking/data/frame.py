@@ -11,9 +11,18 @@ import numpngw
 import os
 import numpy as np
 from PIL import Image
+from deeptracking.data.shardstorage import ShardStorage, frame_record_dtype
+from deeptracking.data.chunkstorage import ChunkStorage
 
 
 class Frame:
+    # dtype of the depth images returned by get_rgb_depth
+    depth_dtype = np.uint16
+    # frames are saved in their own files : different frames can be dumped by different processes
+    parallel_dump = True
+    # files of a frame, formatted with its id
+    file_names = ["{}.png", "{}d.png"]
+
     def __init__(self, rgb, depth, id):
         self.rgb = rgb
         self.depth = depth
@@ -55,36 +64,191 @@ class Frame:
         self.rgb = np.array(Image.open(os.path.join(path, self.id + ".png")))
         self.depth = np.array(Image.open(os.path.join(path, self.id + "d.png"))).astype(np.uint16)
 
+    def move(self, path, output_path, id):
+        """
+        Move the frame saved in path to output_path under another id, the files are renamed (not encoded again). A file
+        already moved by an interrupted call is skipped.
+        :param path:
+        :param output_path:
+        :param id:
+        :return:
+        """
+        for file_name in self.file_names:
+            source = os.path.join(path, file_name.format(self.id))
+            destination = os.path.join(output_path, file_name.format(id))
+            if os.path.exists(source) or not os.path.exists(destination):
+                os.replace(source, destination)
+        self.id = id
+
+    @staticmethod
+    def flush(path):
+        """
+        Called after frames are dumped, formats that keep an index of their frames make the new frames durable here
+        (this is called after every sample : it should only append to the index)
+        :param path:
+        :return:
+        """
+        pass
+
+    @staticmethod
+    def saved(path, ids):
+        """
+        Called after flush : formats that keep frames in memory until a block of them is written (chunks) tell if the
+        frames are on disk
+        :param path:
+        :param ids: frame ids
+        :return: True if all the frames are on disk
+        """
+        return True
+
+    @staticmethod
+    def compact(path):
+        """
+        Called when the dataset is saved, formats that keep an index of their frames write the frames kept in memory
+        and rewrite the index in one file
+        :param path:
+        :return:
+        """
+        pass
+
+    @staticmethod
+    def close(path):
+        """
+        Release what this process keeps open for the frames of path (the folder can then be removed or replaced)
+        :param path:
+        :return:
+        """
+        pass
+
 
 class FrameNumpy(Frame):
+    """
+    Frame saved in a .npy file holding one structured record (see frame_record_dtype) : rgb and depth are loaded as
+    views of the record without any conversion. Frames saved as a h x w x 5 uint8 array (depth split in 2 bytes) by
+    previous versions are still loaded, tools/migrate_numpy_frames.py rewrites them in the record format.
+    """
+    file_names = ["{}.npy"]
+
     def __init__(self, rgb, depth, id):
         super().__init__(rgb, depth, id)
 
     def dump(self, path):
         if not self.is_on_disk():
-            depth8 = self.numpy_int16_to_uint8(self.depth)
-            frame = np.concatenate((self.rgb, depth8), axis=2)
-            np.save(os.path.join(path, self.id), frame)
+            np.save(os.path.join(path, self.id), self.to_record(self.rgb, self.depth))
             self.clear_image()
 
     def load(self, path):
         frame = np.load(os.path.join(path, "{}.npy".format(self.id)))
-        self.depth = self.numpy_uint8_to_int16(frame[:, :, 3:])
-        self.rgb = frame[:, :, 0:3]
+        if self.is_legacy(frame):
+            self.rgb, self.depth = self.from_legacy(frame)
+        else:
+            self.rgb, self.depth = frame["rgb"], frame["depth"]
+
+    @staticmethod
+    def to_record(rgb, depth):
+        record = np.empty((), dtype=frame_record_dtype(*depth.shape[:2]))
+        record["rgb"] = rgb
+        record["depth"] = depth
+        return record
+
+    @staticmethod
+    def is_legacy(frame):
+        return frame.dtype.names is None
+
+    @staticmethod
+    def from_legacy(frame):
+        """
+        Split a legacy h x w x 5 frame : rgb and the depth stored as high byte, low byte (big endian)
+        :param frame:
+        :return:
+        """
+        depth = np.ascontiguousarray(frame[:, :, 3:]).view(">u2")[:, :, 0].astype(np.uint16)
+        return frame[:, :, 0:3], depth
+
+
+class FrameShard(Frame):
+    """
+    Frame stored as a fixed size record in the memory mapped shards of its folder (see ShardStorage)
+    """
+    parallel_dump = False
+
+    def __init__(self, rgb, depth, id):
+        super().__init__(rgb, depth, id)
+
+    def exists(self, path):
+        return self.id in ShardStorage.open(path)
+
+    def dump(self, path):
+        if not self.is_on_disk():
+            ShardStorage.open(path).write(self.id, self.rgb, self.depth)
+            self.clear_image()
+
+    def load(self, path):
+        self.rgb, self.depth = ShardStorage.open(path).read(self.id)
+
+    def move(self, path, output_path, id):
+        # the frame is copied : records of a storage are not removed
+        self.load(path)
+        self.id = id
+        self.dump(output_path)
+
+    @staticmethod
+    def flush(path):
+        ShardStorage.open(path).flush()
+
+    @staticmethod
+    def saved(path, ids):
+        storage = ShardStorage.open(path)
+        return all(storage.saved(id) for id in ids)
+
+    @staticmethod
+    def compact(path):
+        ShardStorage.open(path).save_index()
+
+    @staticmethod
+    def close(path):
+        ShardStorage.close(path)
+
+
+class FrameChunk(Frame):
+    """
+    Frame stored in the compressed chunks of its folder (see ChunkStorage)
+    """
+    parallel_dump = False
+
+    def __init__(self, rgb, depth, id):
+        super().__init__(rgb, depth, id)
+
+    def exists(self, path):
+        return self.id in ChunkStorage.open(path)
+
+    def dump(self, path):
+        if not self.is_on_disk():
+            ChunkStorage.open(path).write(self.id, self.rgb, self.depth)
+            self.clear_image()
+
+    def load(self, path):
+        self.rgb, self.depth = ChunkStorage.open(path).read(self.id)
+
+    def move(self, path, output_path, id):
+        # the frame is copied : records of a storage are not removed
+        self.load(path)
+        self.id = id
+        self.dump(output_path)
+
+    @staticmethod
+    def flush(path):
+        ChunkStorage.open(path).flush()
+
+    @staticmethod
+    def saved(path, ids):
+        storage = ChunkStorage.open(path)
+        return all(storage.saved(id) for id in ids)
 
     @staticmethod
-    def numpy_int16_to_uint8(depth):
-        x, y = depth.shape
-        out = np.ndarray((x, y, 2), dtype=np.uint8)
-        out[:, :, 0] = np.right_shift(depth, 8)
-        out[:, :, 1] = depth.astype(np.uint8)
-        return out
+    def compact(path):
+        ChunkStorage.open(path).save_index()
 
     @staticmethod
-    def numpy_uint8_to_int16(depth8):
-        x, y, c = depth8.shape
-        out = np.ndarray((x, y), dtype=np.int16)
-        out[:, :] = depth8[:, :, 0]
-        out = np.left_shift(out, 8)
-        out[:, :] += depth8[:, :, 1]
-        return out
+    def close(path):
+        ChunkStorage.close(path)
@@ -0,0 +1,40 @@
+"""
+    Registry of the compression codecs used by the chunk frame format (see ChunkStorage). A codec is a pair of
+    functions compress(bytes) -> bytes and decompress(bytes) -> bytes registered under a name, the name is saved with
+    the chunks so they can be read back.
+
+    Available codecs : raw, zlib1, zlib6, bz2, lzma and lz4 (if the lz4 package is installed)
+"""
+
+import zlib
+import bz2
+import lzma
+
+CODECS = {}
+
+
+def register_codec(name, compress, decompress):
+    CODECS[name] = (compress, decompress)
+
+
+def get_codec(name):
+    """
+    :param name:
+    :return: (compress, decompress) functions of the codec
+    """
+    if name not in CODECS:
+        raise Exception("Codec {} is not available, choose one of : {}".format(name, ", ".join(sorted(CODECS))))
+    return CODECS[name]
+
+
+register_codec("raw", bytes, bytes)
+register_codec("zlib1", lambda data: zlib.compress(data, 1), zlib.decompress)
+register_codec("zlib6", lambda data: zlib.compress(data, 6), zlib.decompress)
+register_codec("bz2", lambda data: bz2.compress(data, 9), bz2.decompress)
+register_codec("lzma", lambda data: lzma.compress(data, preset=1), lzma.decompress)
+
+try:
+    import lz4.block
+    register_codec("lz4", lz4.block.compress, lz4.block.decompress)
+except ImportError:
+    pass
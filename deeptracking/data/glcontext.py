@@ -0,0 +1,125 @@
+"""
+    Opengl context backends. The renderer draws in its own framebuffer object (see ModelRenderer), the context only has
+    to be current :
+        glfw   : a (hidden) glfw window, needs a display
+        egl    : offscreen EGL context without surface, on a GPU device or on Mesa (llvmpipe) when there is none
+        osmesa : offscreen Mesa software context
+
+    The backend is given by the DEEPTRACKING_GL environment variable, by default egl is used when no display exists.
+    PyOpenGL binds its platform (PYOPENGL_PLATFORM) when OpenGL is first imported : this module has to be imported
+    before any OpenGL module.
+"""
+
+import ctypes
+import os
+import sys
+
+
+def default_backend():
+    backend = os.environ.get("DEEPTRACKING_GL")
+    if backend is not None:
+        return backend
+    if os.environ.get("PYOPENGL_PLATFORM") in ("egl", "osmesa"):
+        return os.environ["PYOPENGL_PLATFORM"]
+    if sys.platform.startswith("linux") and not os.environ.get("DISPLAY") and not os.environ.get("WAYLAND_DISPLAY"):
+        return "egl"
+    return "glfw"
+
+
+BACKEND = default_backend()
+if BACKEND in ("egl", "osmesa"):
+    os.environ.setdefault("PYOPENGL_PLATFORM", BACKEND)
+if BACKEND not in ("glfw", "egl", "osmesa"):
+    raise Exception("Unknown opengl backend {}, choose one of : glfw, egl, osmesa".format(BACKEND))
+
+
+class GlfwContext:
+    def __init__(self, width, height, hide_window=True):
+        import glfw
+        if not glfw.init():
+            raise Exception("Failed to initialize GLFW")
+        if hide_window:
+            glfw.window_hint(glfw.VISIBLE, glfw.FALSE)
+        self.window = glfw.create_window(width, height, "ViewpointRender", None, None)
+        if not self.window:
+            glfw.terminate()
+            raise Exception("Failed to open GLFW window. If you have an Intel GPU, they are not 3.3 compatible.")
+        glfw.make_context_current(self.window)
+
+
+class EGLContext:
+    EGL_PLATFORM_DEVICE_EXT = 0x313F
+    EGL_PLATFORM_SURFACELESS_MESA = 0x31DD
+
+    def __init__(self, width, height, hide_window=True):
+        from OpenGL import EGL
+        self.display = None
+        for display in self.displays_():
+            major, minor = EGL.EGLint(), EGL.EGLint()
+            try:
+                if EGL.eglInitialize(display, ctypes.pointer(major), ctypes.pointer(minor)):
+                    self.display = display
+                    break
+            except EGL.EGLError:
+                continue
+        if self.display is None:
+            raise Exception("Failed to initialize EGL : no device nor Mesa surfaceless platform")
+        attributes = (EGL.EGLint * 5)(EGL.EGL_SURFACE_TYPE, EGL.EGL_PBUFFER_BIT,
+                                      EGL.EGL_RENDERABLE_TYPE, EGL.EGL_OPENGL_BIT, EGL.EGL_NONE)
+        config = EGL.EGLConfig()
+        config_qty = EGL.EGLint()
+        if not EGL.eglChooseConfig(self.display, attributes, ctypes.pointer(config), 1, ctypes.pointer(config_qty)) \
+                or config_qty.value == 0:
+            raise Exception("Failed to find an EGL config for desktop OpenGL")
+        EGL.eglBindAPI(EGL.EGL_OPENGL_API)
+        self.context = EGL.eglCreateContext(self.display, config, EGL.EGL_NO_CONTEXT, None)
+        # no surface : everything is drawn in framebuffer objects
+        if not EGL.eglMakeCurrent(self.display, EGL.EGL_NO_SURFACE, EGL.EGL_NO_SURFACE, self.context):
+            raise Exception("Failed to make the EGL context current")
+
+    def displays_(self):
+        """
+        Candidate displays : the first device (GPU), the Mesa surfaceless platform, then the default display
+        :return:
+        """
+        from OpenGL import EGL
+        try:
+            from OpenGL.EGL.EXT.device_enumeration import eglQueryDevicesEXT
+            from OpenGL.EGL.EXT.platform_base import eglGetPlatformDisplayEXT
+            devices = (EGL.EGLDeviceEXT * 1)()
+            device_qty = EGL.EGLint()
+            if eglQueryDevicesEXT(1, devices, ctypes.pointer(device_qty)) and device_qty.value > 0:
+                yield eglGetPlatformDisplayEXT(self.EGL_PLATFORM_DEVICE_EXT, devices[0], None)
+        except (ImportError, EGL.EGLError, AttributeError):
+            pass
+        try:
+            yield EGL.eglGetPlatformDisplay(self.EGL_PLATFORM_SURFACELESS_MESA, EGL.EGL_DEFAULT_DISPLAY, None)
+        except (EGL.EGLError, AttributeError):
+            pass
+        yield EGL.eglGetDisplay(EGL.EGL_DEFAULT_DISPLAY)
+
+
+class OSMesaContext:
+    def __init__(self, width, height, hide_window=True):
+        from OpenGL import GL, arrays, osmesa
+        self.context = osmesa.OSMesaCreateContextExt(osmesa.OSMESA_RGBA, 24, 0, 0, None)
+        if not self.context:
+            raise Exception("Failed to create the OSMesa context")
+        # OSMesa needs a color buffer to be current, the renderer draws in its framebuffer objects
+        self.buffer = arrays.GLubyteArray.zeros((1, 1, 4))
+        if not osmesa.OSMesaMakeCurrent(self.context, self.buffer, GL.GL_UNSIGNED_BYTE, 1, 1):
+            raise Exception("Failed to make the OSMesa context current")
+
+
+CONTEXTS = {"glfw": GlfwContext, "egl": EGLContext, "osmesa": OSMesaContext}
+
+
+def create_context(width, height, hide_window=True):
+    """
+    Create an opengl context with the backend of the process and make it current
+    :param width:
+    :param height:
+    :param hide_window: glfw only
+    :return: the context (keep a reference while rendering)
+    """
+    return CONTEXTS[BACKEND](width, height, hide_window)
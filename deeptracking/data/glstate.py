@@ -0,0 +1,99 @@
+"""
+    Cache of the opengl state set by the renderers : a call that would set a state to its current value is skipped.
+
+    The cache assumes one opengl context per process (see InitOpenGL, which resets it) and that the cached states are
+    only changed through it. Texture parameters are cached per bound texture and uniforms per bound program.
+"""
+
+# selects the PyOpenGL platform : has to be imported before OpenGL
+import deeptracking.data.glcontext
+from OpenGL.GL import *
+import numpy as np
+
+
+class GlState:
+    def __init__(self):
+        # False : every call is issued (used to measure the cache, see tools/benchmark_render_state.py)
+        self.enabled = True
+        self.reset()
+
+    def reset(self):
+        """
+        Forget the cached values, to call when a new context is made current
+        :return:
+        """
+        self.values = {}
+        self.issued_qty = 0
+        self.skipped_qty = 0
+
+    def set_(self, key, value, function, *args):
+        """
+        Call function(*args) unless the state key already has the value
+        :param key: state changed by the call, None if it can not be cached
+        :param value: value of the state after the call
+        :param function: opengl function
+        :param args:
+        :return:
+        """
+        if self.enabled and key is not None and key in self.values and self.values[key] == value:
+            self.skipped_qty += 1
+            return
+        function(*args)
+        self.issued_qty += 1
+        if key is not None:
+            self.values[key] = value
+
+    def bound_(self, key):
+        return self.values.get(key)
+
+    def use_program(self, program):
+        self.set_("program", program, glUseProgram, program)
+
+    def bind_framebuffer(self, framebuffer):
+        self.set_("framebuffer", framebuffer, glBindFramebuffer, GL_FRAMEBUFFER, framebuffer)
+
+    def delete_framebuffers(self, framebuffers):
+        glDeleteFramebuffers(len(framebuffers), framebuffers)
+        # the names can be reused by the next framebuffers
+        for framebuffer in framebuffers:
+            self.values.pop(("read_buffer", framebuffer), None)
+            if self.bound_("framebuffer") == framebuffer:
+                self.values["framebuffer"] = 0
+
+    def bind_texture(self, target, texture):
+        self.set_(("texture", target), texture, glBindTexture, target, texture)
+
+    def viewport(self, x, y, width, height):
+        self.set_("viewport", (x, y, width, height), glViewport, x, y, width, height)
+
+    def read_buffer(self, buffer):
+        # read buffer of the bound framebuffer
+        framebuffer = self.bound_("framebuffer")
+        key = ("read_buffer", framebuffer) if framebuffer is not None else None
+        self.set_(key, buffer, glReadBuffer, buffer)
+
+    def enable(self, capability):
+        self.set_(("enable", capability), True, glEnable, capability)
+
+    def tex_env(self, target, name, value):
+        self.set_(("tex_env", target, name), value, glTexEnvf, target, name, value)
+
+    def tex_parameter(self, target, name, value):
+        texture = self.bound_(("texture", target))
+        key = ("tex_parameter", texture, name) if texture is not None else None
+        self.set_(key, value, glTexParameteri, target, name, value)
+
+    def uniform3f(self, location, x, y, z):
+        value = (float(x), float(y), float(z))
+        self.set_(self.uniform_key_(location), value, glUniform3f, location, *value)
+
+    def uniform_matrix4fv(self, location, matrix):
+        value = np.asarray(matrix, dtype=np.float32).tobytes()
+        self.set_(self.uniform_key_(location), value, glUniformMatrix4fv, location, 1, GL_FALSE, matrix)
+
+    def uniform_key_(self, location):
+        program = self.bound_("program")
+        return ("uniform", program, location) if program is not None else None
+
+
+gl_state = GlState()
@@ -9,14 +9,22 @@
 __author__ = "Mathieu Garon"
 __version__ = "0.0.1"
 
+# selects the PyOpenGL platform : has to be imported before OpenGL
+from deeptracking.data.glcontext import create_context
 from OpenGL.GL import shaders
-import glfw
 from deeptracking.data.glew import *
+from deeptracking.data.glstate import gl_state
+from deeptracking.data.rendererbase import RendererBase
 from deeptracking.utils.plyparser import PlyParser
 import numpy as np
 
 
-class ModelRenderer:
+class ModelRenderer(RendererBase):
+    CLEAR_COLOR = np.zeros(4, dtype=np.float32)
+    CLEAR_DEPTH = np.zeros(4, dtype=np.uint32)
+    # renders drawn per pass of render_batch
+    atlas_max_renders = 32
+
     def __init__(self, model_path, shader_path, camera, window, window_size):
         self.model_3d = PlyParser(model_path)
         self.camera = camera
@@ -26,6 +34,7 @@ class ModelRenderer:
         self.texcoord_buffer = None
 
         self.setup_shaders(shader_path)
+        self.setup_framebuffer(window_size)
         self.setup_buffers(self.model_3d)
         self.setup_attributes()
         self.setup_camera(self.camera, 0, self.camera.width, self.camera.height, 0)
@@ -38,8 +47,77 @@ class ModelRenderer:
             fragment_shader_data = myfile.read()
         FRAGMENT_SHADER = shaders.compileShader(fragment_shader_data, GL_FRAGMENT_SHADER)
         self.shader_program = shaders.compileProgram(VERTEX_SHADER, FRAGMENT_SHADER)
+        # outputs of the fragment shader : shaded color and linear depth (mm) in the color attachments 0 and 1
+        glBindFragDataLocation(self.shader_program, 0, "color")
+        glBindFragDataLocation(self.shader_program, 1, "depth")
         glLinkProgram(self.shader_program)
-        glUseProgram(self.shader_program)
+        gl_state.use_program(self.shader_program)
+
+    def setup_framebuffer(self, size):
+        """
+        Renders are drawn in a framebuffer object of the render size (width, height) : the size does not depend on the
+        window or the context. The shaders write the color in an RGBA8 attachment and the depth in millimeters in an
+        R16UI attachment, both are read back in one pixel buffer.
+        :param size:
+        :return:
+        """
+        self.framebuffer, self.renderbuffers = self.create_framebuffer_(size[0], size[1])
+        gl_state.viewport(0, 0, size[0], size[1])
+
+        # double buffered readback : depth (2 bytes) then rgb (3 bytes) of each pixel, rows are not padded
+        glPixelStorei(GL_PACK_ALIGNMENT, 1)
+        self.pixel_buffers = glGenBuffers(2)
+        self.pixel_buffer_renders = [0] * len(self.pixel_buffers)
+        self.render_qty = 0
+        for pixel_buffer in self.pixel_buffers:
+            glBindBuffer(GL_PIXEL_PACK_BUFFER, pixel_buffer)
+            glBufferData(GL_PIXEL_PACK_BUFFER, size[0] * size[1] * 5, None, GL_STREAM_READ)
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, 0)
+
+        # atlas of render_batch, allocated on the first batch
+        self.atlas_framebuffer = None
+        self.atlas_renderbuffers = None
+        self.atlas_pixel_buffer = None
+        self.atlas_capacity = 0
+
+    @staticmethod
+    def create_framebuffer_(width, height):
+        framebuffer = glGenFramebuffers(1)
+        gl_state.bind_framebuffer(framebuffer)
+        renderbuffers = glGenRenderbuffers(3)
+        attachments = [(GL_RGBA8, GL_COLOR_ATTACHMENT0),
+                       (GL_R16UI, GL_COLOR_ATTACHMENT1),
+                       (GL_DEPTH_COMPONENT24, GL_DEPTH_ATTACHMENT)]
+        for renderbuffer, (internal_format, attachment) in zip(renderbuffers, attachments):
+            glBindRenderbuffer(GL_RENDERBUFFER, renderbuffer)
+            glRenderbufferStorage(GL_RENDERBUFFER, internal_format, width, height)
+            glFramebufferRenderbuffer(GL_FRAMEBUFFER, attachment, GL_RENDERBUFFER, renderbuffer)
+        if glCheckFramebufferStatus(GL_FRAMEBUFFER) != GL_FRAMEBUFFER_COMPLETE:
+            raise Exception("Framebuffer of size {} is incomplete".format((width, height)))
+        glDrawBuffers(2, [GL_COLOR_ATTACHMENT0, GL_COLOR_ATTACHMENT1])
+        return framebuffer, renderbuffers
+
+    def setup_atlas_(self, render_qty):
+        """
+        Allocate the atlas of render_batch : renders are stacked vertically in one framebuffer, at most
+        atlas_max_renders or the maximum renderbuffer height
+        :param render_qty: number of renders of the batch
+        :return: number of renders drawn per pass
+        """
+        width, height = self.window_size
+        capacity = min(render_qty, self.atlas_max_renders, glGetIntegerv(GL_MAX_RENDERBUFFER_SIZE) // height)
+        if capacity > self.atlas_capacity:
+            if self.atlas_framebuffer is not None:
+                gl_state.delete_framebuffers([self.atlas_framebuffer])
+                glDeleteRenderbuffers(len(self.atlas_renderbuffers), self.atlas_renderbuffers)
+                glDeleteBuffers(1, [self.atlas_pixel_buffer])
+            self.atlas_framebuffer, self.atlas_renderbuffers = self.create_framebuffer_(width, height * capacity)
+            self.atlas_pixel_buffer = glGenBuffers(1)
+            glBindBuffer(GL_PIXEL_PACK_BUFFER, self.atlas_pixel_buffer)
+            glBufferData(GL_PIXEL_PACK_BUFFER, width * height * capacity * 5, None, GL_STREAM_READ)
+            glBindBuffer(GL_PIXEL_PACK_BUFFER, 0)
+            self.atlas_capacity = capacity
+        return self.atlas_capacity
 
     def setup_buffers(self, plyparser):
         # ---- Setup data ----
@@ -85,8 +163,8 @@ class ModelRenderer:
         texture = plyparser.get_texture()
         if texture is not None:
             tex = texture[::-1, :, :]
-        glBindTexture(GL_TEXTURE_2D, self.texture)
-        glEnable(GL_TEXTURE_2D)
+        gl_state.bind_texture(GL_TEXTURE_2D, self.texture)
+        gl_state.enable(GL_TEXTURE_2D)
         glTexImage2D(GL_TEXTURE_2D, 0, GL_RGB, tex.shape[1], tex.shape[0], 0, GL_RGB, GL_UNSIGNED_BYTE, tex)
         glGenerateMipmap(GL_TEXTURE_2D)
 
@@ -115,13 +193,13 @@ class ModelRenderer:
             'lightB_diffuse': glGetUniformLocation(self.shader_program, 'lightB.diffuse')
         }
 
-        glUniform3f(self.uniform_locations['lightA_direction'], -1, -1, 1)
-        glUniform3f(self.uniform_locations['lightA_diffuse'], 1, 1, 1)
+        gl_state.uniform3f(self.uniform_locations['lightA_direction'], -1, -1, 1)
+        gl_state.uniform3f(self.uniform_locations['lightA_diffuse'], 1, 1, 1)
 
-        glUniform3f(self.uniform_locations['lightB_direction'], 1, 1, 1)
-        glUniform3f(self.uniform_locations['lightB_diffuse'], 0, 0, 0)
+        gl_state.uniform3f(self.uniform_locations['lightB_direction'], 1, 1, 1)
+        gl_state.uniform3f(self.uniform_locations['lightB_diffuse'], 0, 0, 0)
 
-        glUniform3f(self.uniform_locations['ambientLightForce'], 0.65, 0.65, 0.65)
+        gl_state.uniform3f(self.uniform_locations['ambientLightForce'], 0.65, 0.65, 0.65)
         glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.buffer_index)  # bind faces buffer
 
     def load_ambiant_occlusion_map(self, path):
@@ -135,114 +213,157 @@ class ModelRenderer:
             print("[WARNING] ViewpointRender: ambiant occlusion file not found ... continue with basic render")
 
     def setup_camera(self, camera, left, right, bottom, top):
-        self.near_plane = 0.1
-        self.far_plane = 2
-
-        # credit : http://ksimek.github.io/2013/06/03/calibrated_cameras_in_opengl/
-        proj = np.array([[camera.focal_x, 0, -camera.center_x, 0],
-                         [0, camera.focal_y, -camera.center_y, 0],
-                         [0, 0, self.near_plane + self.far_plane, self.near_plane * self.far_plane],
-                         [0, 0, -1, 0]])
-        self.projection_matrix = ModelRenderer.orthographicMatrix(left,
-                                                                  right,
-                                                                  bottom,
-                                                                  top,
-                                                                  self.near_plane,
-                                                                  self.far_plane).dot(proj).T
-
-        glUniformMatrix4fv(self.uniform_locations['proj'], 1, GL_FALSE, self.projection_matrix)
-
-    @staticmethod
-    def orthographicMatrix(left, right, bottom, top, near, far):
-        right = float(right)
-        left = float(left)
-        top = float(top)
-        bottom = float(bottom)
-        mat = np.array([[2. / (right - left), 0, 0, -(right + left) / (right - left)],
-                        [0, 2. / (top - bottom), 0, -(top + bottom) / (top - bottom)],
-                        [0, 0, -2 / (far - near), -(far + near) / (far - near)],
-                        [0, 0, 0, 1]], dtype=np.float32)
-        return mat
-
-    def gldepth_to_worlddepth(self, frame):
-        A = self.projection_matrix[2, 2]
-        B = self.projection_matrix[3, 2]
-        distance = B / (frame * -2.0 + 1.0 - A) * -1
-        idx = distance[:, :] >= B / (A + 1)
-        distance[idx] = 0
-        return (distance * 1000).astype(np.uint16)
+        RendererBase.setup_camera(self, camera, left, right, bottom, top)
+        gl_state.use_program(self.shader_program)
+        gl_state.uniform_matrix4fv(self.uniform_locations['proj'], self.projection_matrix)
 
     def render(self, view_transform, light_direction=None, light_diffuse=None):
+        return self.read(self.render_async(view_transform, light_direction, light_diffuse))
+
+    def render_async(self, view_transform, light_direction=None, light_diffuse=None):
+        """
+        Draw and start the readback of the render in a pixel buffer object : the call returns before the pixels are
+        transferred, the cpu can work until read is called. At most len(pixel_buffers) renders can wait to be read.
+        :param view_transform:
+        :param light_direction:
+        :param light_diffuse:
+        :return: handle of the render, see read
+        """
+        self.setup_view_(view_transform, light_direction, light_diffuse)
+        self.begin_draw_(self.framebuffer)
+        gl_state.viewport(0, 0, self.window_size[0], self.window_size[1])
+        glDrawElements(GL_TRIANGLES, len(self.faces) * 3, GL_UNSIGNED_INT, ctypes.c_void_p(0))
+
+        # -- start the readback : depth then rgb in the next pixel buffer
+        width, height = self.window_size
+        self.render_qty += 1
+        slot = self.render_qty % len(self.pixel_buffers)
+        self.pixel_buffer_renders[slot] = self.render_qty
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, self.pixel_buffers[slot])
+        self.read_pixels_(width, height)
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, 0)
+        return slot, self.render_qty
+
+    def render_batch(self, view_transforms, light_directions=None, light_diffuses=None):
+        """
+        Render many poses with the current camera (see setup_crop) : the poses are drawn in the viewports of an atlas
+        framebuffer, the draw state is set once per pass and the atlas is read back in one transfer
+        :param view_transforms: list of view transforms
+        :param light_directions: list (None for the default direction), same length as view_transforms
+        :param light_diffuses: list (None for the default diffuse), same length as view_transforms
+        :return: rgb (N, height, width, 3) and depth (N, height, width) images
+        """
+        render_qty = len(view_transforms)
+        if light_directions is None:
+            light_directions = [None] * render_qty
+        if light_diffuses is None:
+            light_diffuses = [None] * render_qty
+        width, height = self.window_size
+        rgb = np.empty((render_qty, height, width, 3), dtype=np.uint8)
+        depth = np.empty((render_qty, height, width), dtype=np.uint16)
+        if render_qty == 0:
+            return rgb, depth
+        capacity = self.setup_atlas_(render_qty)
+        for start in range(0, render_qty, capacity):
+            end = min(start + capacity, render_qty)
+            self.begin_draw_(self.atlas_framebuffer)
+            for i in range(start, end):
+                self.setup_view_(view_transforms[i], light_directions[i], light_diffuses[i])
+                gl_state.viewport(0, (i - start) * height, width, height)
+                glDrawElements(GL_TRIANGLES, len(self.faces) * 3, GL_UNSIGNED_INT, ctypes.c_void_p(0))
+            pixel_qty = width * height * (end - start)
+            glBindBuffer(GL_PIXEL_PACK_BUFFER, self.atlas_pixel_buffer)
+            self.read_pixels_(width, height * (end - start))
+            data = glGetBufferSubData(GL_PIXEL_PACK_BUFFER, 0, pixel_qty * 5)
+            glBindBuffer(GL_PIXEL_PACK_BUFFER, 0)
+            depth[start:end] = np.frombuffer(data, dtype=np.uint16, count=pixel_qty).reshape((-1, height, width))
+            rgb[start:end] = np.frombuffer(data, dtype=np.uint8, offset=pixel_qty * 2).reshape((-1, height, width, 3))
+        return rgb, depth
+
+    def setup_view_(self, view_transform, light_direction, light_diffuse):
+        gl_state.use_program(self.shader_program)
         light_normal = np.ones(4)
         if light_direction is None:
             light_direction = np.array([0, 0.1, -0.9])
         light_normal[0:3] = light_direction
         light_direction = np.dot(view_transform.inverse().matrix, light_normal)
-        glUniform3f(self.uniform_locations['lightA_direction'], light_direction[0], light_direction[1],
-                    light_direction[2])
+        gl_state.uniform3f(self.uniform_locations['lightA_direction'], light_direction[0], light_direction[1],
+                           light_direction[2])
 
         if light_diffuse is None:
             light_diffuse = np.array([0.4, 0.4, 0.4])
-        glUniform3f(self.uniform_locations['lightA_diffuse'], light_diffuse[0], light_diffuse[1], light_diffuse[2])
+        gl_state.uniform3f(self.uniform_locations['lightA_diffuse'], light_diffuse[0], light_diffuse[1],
+                           light_diffuse[2])
+
+        gl_state.uniform_matrix4fv(self.uniform_locations['view'], view_transform.matrix)
+
+    def begin_draw_(self, framebuffer):
+        gl_state.bind_framebuffer(framebuffer)
+        glClear(GL_DEPTH_BUFFER_BIT)
+        # the integer depth attachment can not be cleared with the clear color
+        glClearBufferfv(GL_COLOR, 0, self.CLEAR_COLOR)
+        glClearBufferuiv(GL_COLOR, 1, self.CLEAR_DEPTH)
+
+        # skipped by the state cache once set
+        gl_state.enable(GL_MULTISAMPLE)
+        gl_state.enable(GL_TEXTURE_2D)
+        gl_state.bind_texture(GL_TEXTURE_2D, self.texture)
+        gl_state.tex_env(GL_TEXTURE_ENV, GL_TEXTURE_ENV_MODE, GL_DECAL)
+        gl_state.tex_parameter(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_REPEAT)
+        gl_state.tex_parameter(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_REPEAT)
+        gl_state.tex_parameter(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
+        gl_state.tex_parameter(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR_MIPMAP_LINEAR)
 
-        glUniformMatrix4fv(self.uniform_locations['view'], 1, GL_FALSE, view_transform.matrix)
-
-        # --- draw window ---
-        glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
-
-        glEnable(GL_MULTISAMPLE)
-        glEnable(GL_TEXTURE_2D)
-        glTexEnvf(GL_TEXTURE_ENV, GL_TEXTURE_ENV_MODE, GL_DECAL)
-        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_REPEAT)
-        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_REPEAT)
-        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
-        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR_MIPMAP_LINEAR)
-
-        glDrawElements(GL_TRIANGLES, len(self.faces) * 3, GL_UNSIGNED_INT, ctypes.c_void_p(0))
-
-        # -- retrieve data
-        depth_array = glReadPixels(0, 0, self.window_size[0], self.window_size[1], GL_DEPTH_COMPONENT, GL_FLOAT)
-        depth_array = depth_array.reshape(self.window_size[::-1])
-        depth_array = self.gldepth_to_worlddepth(depth_array)
-        rgb_array = glReadPixels(0, 0, self.window_size[0], self.window_size[1], GL_RGB, GL_UNSIGNED_BYTE)
-        rgb_array = np.frombuffer(rgb_array, dtype=np.uint8).reshape((self.window_size[1], self.window_size[0], 3))
+    @staticmethod
+    def read_pixels_(width, height):
+        """
+        Read the depth then the rgb of the bound framebuffer in the bound pixel pack buffer
+        """
+        gl_state.read_buffer(GL_COLOR_ATTACHMENT1)
+        glReadPixels(0, 0, width, height, GL_RED_INTEGER, GL_UNSIGNED_SHORT, ctypes.c_void_p(0))
+        gl_state.read_buffer(GL_COLOR_ATTACHMENT0)
+        glReadPixels(0, 0, width, height, GL_RGB, GL_UNSIGNED_BYTE, ctypes.c_void_p(width * height * 2))
+
+    def read(self, render):
+        """
+        Wait for the pixels of a render started with render_async
+        :param render: handle returned by render_async
+        :return: rgb and depth (mm) images, rows from the bottom of the image
+        """
+        slot, render_id = render
+        if self.pixel_buffer_renders[slot] != render_id:
+            raise Exception("Render {} is overwritten : only the last {} renders can be read".format(
+                render_id, len(self.pixel_buffers)))
+        width, height = self.window_size
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, self.pixel_buffers[slot])
+        data = glGetBufferSubData(GL_PIXEL_PACK_BUFFER, 0, width * height * 5)
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, 0)
+        depth_array = np.frombuffer(data, dtype=np.uint16, count=width * height).reshape((height, width))
+        rgb_array = np.frombuffer(data, dtype=np.uint8, offset=width * height * 2).reshape((height, width, 3))
         return rgb_array, depth_array
 
 
 def InitOpenGL(width, height, hide_window=True):
     """
-    dpy = Display()
-    conf = pegl.config.get_configs(dpy, {'RENDERABLE_TYPE': ClientAPIs(OPENGL=1),
-                                         "SURFACE_TYPE": SurfaceTypes(PBUFFER=1),
-                                         "BLUE_SIZE": 8,
-                                         "GREEN_SIZE": 8,
-                                         "RED_SIZE": 8,
-                                         "DEPTH_SIZE": 8})
-    conf = conf[0]
-    surf = pegl.surface.PbufferSurface(dpy, conf, {'WIDTH': width, 'HEIGHT': height})
-
-    pegl.context.bind_api(ContextAPIs.OPENGL)
-    ctx = pegl.context.Context(dpy, conf)
-    ctx.make_current(draw_surface=surf)
+    Create the opengl context of the process (see glcontext for the backends : a glfw window, or an offscreen EGL or
+    OSMesa context when there is no display)
+    :param width:
+    :param height:
+    :param hide_window:
+    :return: the context, keep a reference while rendering
     """
-    if not glfw.init():
-        print("Failed to initialize GLFW\n", file=sys.stderr)
-        sys.exit(-1)
-    window = glfw.create_window(width, height, "ViewpointRender", None, None)
-    if not window:
-        print(
-            "Failed to open GLFW window. If you have an Intel GPU, they are not 3.3 compatible. Try the 2.1 version of the tutorials.\n",
-            file=sys.stderr)
-        glfw.terminate()
+    try:
+        context = create_context(width, height, hide_window)
+    except Exception as e:
+        print("Failed to create the opengl context : {}\n".format(e), file=sys.stderr)
         sys.exit(-1)
-    glfw.make_context_current(window)
+    gl_state.reset()
 
     glewExperimental = True
     if glewInit() != GLEW_OK:
         print("Failed to initialize GLEW\n", file=sys.stderr)
         sys.exit(-1)
     glClearColor(0, 0, 0, 0)
-    window = None
 
     # Opengl Flags
     glEnable(GL_DEPTH_TEST)
@@ -250,4 +371,4 @@ def InitOpenGL(width, height, hide_window=True):
     glDepthFunc(GL_LESS)
     glDepthRange(0.0, 1.0)
 
-    return window
+    return context
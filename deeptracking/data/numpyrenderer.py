@@ -0,0 +1,192 @@
+"""
+    Cpu reference of ModelRenderer written with numpy : renders on machines without opengl and serves as an oracle of
+    the opengl path. Same interface and same outputs : rgb (uint8) and depth (uint16 mm) with the rows ordered from the
+    bottom of the image, as read back from opengl.
+
+    Triangles are rasterized at the pixel centers with a 24 bits z-buffer (GL_LESS, no face culling), vertex attributes
+    are interpolated with perspective correction and shaded as in shaders/fragment_light.txt. Textures are sampled
+    bilinearly without mipmaps.
+"""
+
+import numpy as np
+from deeptracking.data.rendererbase import RendererBase
+from deeptracking.utils.plyparser import PlyParser
+
+DEPTH_MAX = (1 << 24) - 1
+
+
+class NumpyRenderer(RendererBase):
+    # candidate fragments evaluated at once (bounds the memory used by large triangles)
+    batch_fragments = 1 << 20
+    ambient_light_force = 0.65
+
+    def __init__(self, model_path, shader_path, camera, window, window_size):
+        """
+        :param model_path:
+        :param shader_path: unused, the shading of the opengl shaders is reproduced
+        :param camera:
+        :param window: unused, no context is needed
+        :param window_size: render size (width, height)
+        """
+        self.model_3d = PlyParser(model_path)
+        self.camera = camera
+        self.window = window
+        self.window_size = window_size
+        self.setup_buffers(self.model_3d)
+        self.setup_camera(self.camera, 0, self.camera.width, self.camera.height, 0)
+
+    def setup_buffers(self, plyparser):
+        vertex = plyparser.get_vertex()
+        # homogeneous coordinates
+        self.vertex = np.hstack((vertex, np.ones((len(vertex), 1), dtype=np.float32)))
+        self.color = plyparser.get_vertex_color().astype(np.float32) / 255.
+        normals = plyparser.get_vertex_normals()
+        self.normals = normals / np.linalg.norm(normals, axis=1)[:, np.newaxis]
+        self.ambiant_occlusion = np.ones((len(self.vertex), 3), dtype=np.float32)
+        self.faces = plyparser.get_faces()
+        try:
+            self.texcoord = plyparser.get_texture_coord()
+        except KeyError:
+            self.texcoord = None
+        texture = plyparser.get_texture()
+        self.texture = None
+        if texture is not None:
+            self.texture = texture[::-1, :, :3].astype(np.float32) / 255.
+
+    def load_ambiant_occlusion_map(self, path):
+        try:
+            ao_model = PlyParser(path)
+            self.ambiant_occlusion = ao_model.get_vertex_color().astype(np.float32) / 255
+        except FileNotFoundError:
+            print("[WARNING] ViewpointRender: ambiant occlusion file not found ... continue with basic render")
+
+    def render(self, view_transform, light_direction=None, light_diffuse=None):
+        light_normal = np.ones(4)
+        if light_direction is None:
+            light_direction = np.array([0, 0.1, -0.9])
+        light_normal[0:3] = light_direction
+        light_direction = np.dot(view_transform.inverse().matrix, light_normal)[:3]
+        if light_diffuse is None:
+            light_diffuse = np.array([0.4, 0.4, 0.4])
+
+        width, height = self.window_size
+        # the view and projection uniforms are column major : row vectors are multiplied by the uploaded matrices
+        clip = self.vertex.dot(view_transform.matrix.astype(np.float32)).dot(self.projection_matrix.astype(np.float32))
+        w = clip[:, 3]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ndc = clip[:, :3] / w[:, np.newaxis]
+        screen = np.empty((len(clip), 3), dtype=np.float64)
+        screen[:, 0] = (ndc[:, 0] + 1) * 0.5 * width
+        screen[:, 1] = (ndc[:, 1] + 1) * 0.5 * height
+        screen[:, 2] = ndc[:, 2] * 0.5 + 0.5
+
+        depth_buffer = np.full(width * height, DEPTH_MAX, dtype=np.int64)
+        face_buffer = np.full(width * height, -1, dtype=np.int64)
+        barycentric_buffer = np.zeros((width * height, 3), dtype=np.float64)
+        self.rasterize_(screen, w, width, height, depth_buffer, face_buffer, barycentric_buffer)
+
+        rgb = np.zeros((height * width, 3), dtype=np.uint8)
+        pixels = np.flatnonzero(face_buffer >= 0)
+        if len(pixels):
+            rgb[pixels] = self.shade_(face_buffer[pixels], barycentric_buffer[pixels], w, light_direction,
+                                      light_diffuse)
+        depth_array = (depth_buffer.astype(np.float64) / DEPTH_MAX).astype(np.float32).reshape(height, width)
+        depth_array = self.gldepth_to_worlddepth(depth_array)
+        return rgb.reshape(height, width, 3), depth_array
+
+    def rasterize_(self, screen, w, width, height, depth_buffer, face_buffer, barycentric_buffer):
+        triangles = screen[self.faces]
+        v0, v1, v2 = triangles[:, 0], triangles[:, 1], triangles[:, 2]
+        area = (v1[:, 0] - v0[:, 0]) * (v2[:, 1] - v0[:, 1]) - (v1[:, 1] - v0[:, 1]) * (v2[:, 0] - v0[:, 0])
+        # pixel centers (x + 0.5, y + 0.5) inside the bounding box of each triangle
+        with np.errstate(invalid='ignore'):
+            col_min = np.maximum(np.ceil(triangles[:, :, 0].min(axis=1) - 0.5), 0)
+            col_max = np.minimum(np.floor(triangles[:, :, 0].max(axis=1) - 0.5), width - 1)
+            row_min = np.maximum(np.ceil(triangles[:, :, 1].min(axis=1) - 0.5), 0)
+            row_max = np.minimum(np.floor(triangles[:, :, 1].max(axis=1) - 0.5), height - 1)
+            visible = np.all(w[self.faces] > 0, axis=1) & (area != 0) & (col_max >= col_min) & (row_max >= row_min)
+        faces = np.flatnonzero(visible)
+        col_qty = (col_max[faces] - col_min[faces] + 1).astype(np.int64)
+        fragment_qty = col_qty * (row_max[faces] - row_min[faces] + 1).astype(np.int64)
+
+        cumulative = np.cumsum(fragment_qty)
+        start = 0
+        while start < len(faces):
+            # batch of triangles with at most batch_fragments candidates (or one large triangle)
+            offset = cumulative[start - 1] if start > 0 else 0
+            end = max(np.searchsorted(cumulative, offset + self.batch_fragments, side='right'), start + 1)
+            batch = slice(start, end)
+            face = np.repeat(faces[batch], fragment_qty[batch])
+            first = cumulative[batch] - fragment_qty[batch] - offset
+            local = np.arange(len(face)) - np.repeat(first, fragment_qty[batch])
+            qty = np.repeat(col_qty[batch], fragment_qty[batch])
+            col = col_min[face].astype(np.int64) + local % qty
+            row = row_min[face].astype(np.int64) + local // qty
+            self.resolve_(face, col, row, triangles, area, width, depth_buffer, face_buffer, barycentric_buffer)
+            start = end
+
+    def resolve_(self, face, col, row, triangles, area, width, depth_buffer, face_buffer, barycentric_buffer):
+        x = col + 0.5
+        y = row + 0.5
+        v0, v1, v2 = triangles[face, 0], triangles[face, 1], triangles[face, 2]
+        barycentric = np.empty((len(face), 3), dtype=np.float64)
+        barycentric[:, 0] = (v2[:, 0] - v1[:, 0]) * (y - v1[:, 1]) - (v2[:, 1] - v1[:, 1]) * (x - v1[:, 0])
+        barycentric[:, 1] = (v0[:, 0] - v2[:, 0]) * (y - v2[:, 1]) - (v0[:, 1] - v2[:, 1]) * (x - v2[:, 0])
+        barycentric[:, 2] = (v1[:, 0] - v0[:, 0]) * (y - v0[:, 1]) - (v1[:, 1] - v0[:, 1]) * (x - v0[:, 0])
+        barycentric /= area[face][:, np.newaxis]
+        z = barycentric[:, 0] * v0[:, 2] + barycentric[:, 1] * v1[:, 2] + barycentric[:, 2] * v2[:, 2]
+        # inside the triangle and between the near and far planes
+        inside = np.all(barycentric >= 0, axis=1) & (z >= 0) & (z <= 1)
+        face, barycentric, pixel = face[inside], barycentric[inside], (row * width + col)[inside]
+        depth = np.round(z[inside] * DEPTH_MAX).astype(np.int64)
+
+        # nearest fragment of each pixel, the first drawn triangle on equal depth (GL_LESS)
+        order = np.lexsort((face, depth, pixel))
+        pixel, depth = pixel[order], depth[order]
+        first = np.ones(len(pixel), dtype=bool)
+        first[1:] = pixel[1:] != pixel[:-1]
+        nearest = order[first]
+        pixel, depth = pixel[first], depth[first]
+        closer = depth < depth_buffer[pixel]
+        pixel = pixel[closer]
+        depth_buffer[pixel] = depth[closer]
+        face_buffer[pixel] = face[nearest[closer]]
+        barycentric_buffer[pixel] = barycentric[nearest[closer]]
+
+    def shade_(self, face, barycentric, w, light_direction, light_diffuse):
+        vertices = self.faces[face]
+        # perspective correct interpolation
+        barycentric = barycentric / w[vertices]
+        barycentric /= barycentric.sum(axis=1)[:, np.newaxis]
+
+        def interpolate(attribute):
+            return np.einsum('ij,ijk->ik', barycentric, attribute[vertices])
+
+        # the model uniform of the shader is never set : the fragment position is 0 and the light direction is constant
+        light = -light_direction / np.linalg.norm(light_direction)
+        diffuse = np.maximum(interpolate(self.normals).dot(light), 0)[:, np.newaxis] * light_diffuse
+        color = interpolate(self.color)
+        if self.texture is not None:
+            texcoord = interpolate(self.texcoord) if self.texcoord is not None else np.zeros((len(face), 2))
+            color *= self.sample_texture_(texcoord)
+        shade = (diffuse + interpolate(self.ambiant_occlusion) * self.ambient_light_force) * color
+        return np.round(np.clip(shade, 0, 1) * 255).astype(np.uint8)
+
+    def sample_texture_(self, texcoord):
+        height, width = self.texture.shape[:2]
+        # GL_REPEAT wrapping, GL_LINEAR filtering
+        x = texcoord[:, 0] * width - 0.5
+        y = texcoord[:, 1] * height - 0.5
+        x0 = np.floor(x)
+        y0 = np.floor(y)
+        fx = (x - x0)[:, np.newaxis]
+        fy = (y - y0)[:, np.newaxis]
+        x0 = x0.astype(np.int64)
+        y0 = y0.astype(np.int64)
+        x1 = (x0 + 1) % width
+        y1 = (y0 + 1) % height
+        x0 %= width
+        y0 %= height
+        top = self.texture[y0, x0] * (1 - fx) + self.texture[y0, x1] * fx
+        bottom = self.texture[y1, x0] * (1 - fx) + self.texture[y1, x1] * fx
+        return top * (1 - fy) + bottom * fy
@@ -12,16 +12,52 @@ import time
 import numpy as np
 from PIL import Image
 import abc
-from multiprocessing import Process, Queue, cpu_count, JoinableQueue
+from multiprocessing import Process, Queue, Value, cpu_count, JoinableQueue
+from multiprocessing.sharedctypes import RawArray
 
 
 class ParallelMinibatch:
-    def __init__(self, max_size=0):
-        self.max_size = max_size
-        self.N_Process = cpu_count()
+    def __init__(self, max_size=0, shared_memory=False, ordered=False, seed=None, process_qty=0, max_memory=0,
+                 stream=0):
+        """
+        :param max_size: prefetch depth, maximum number of minibatches loaded ahead of the consumer
+                         (0 is number of processes + 2)
+        :param shared_memory: if True, workers write minibatches in preallocated shared memory slots and only the slot
+                              index goes through the results queue. The minibatch yielded by get_minibatch is then a
+                              view that stays valid until the next minibatch is requested.
+        :param ordered: if True, minibatches are yielded in the order of the permutation instead of completion order
+        :param seed: if not None, permutations and the random state given to each task are derived from
+                     (seed, stream, epoch, task) so an epoch can be replayed exactly
+        :param process_qty: number of worker processes (0 is cpu_count)
+        :param max_memory: if > 0, memory cap in bytes of the minibatches loaded ahead, the prefetch depth is reduced
+                           to fit (needs minibatch_buffers_)
+        :param stream: id of the random streams of this loader, loaders built with the same seed need different
+                       streams to get uncorrelated permutations and random states (e.g. train and valid)
+        """
+        self.buffer_size = max_size
+        self.shared_memory = shared_memory
+        self.ordered = ordered
+        self.seed = seed
+        self.stream = stream
+        self.N_Process = process_qty if process_qty > 0 else cpu_count()
+        self.max_memory = max_memory
         self.tasks = None
         self.results = None
+        self.free_slots = None
+        self.slots = None
         self.processes = []
+        self.current_epoch = None
+        self.epoch = 0
+        self.epoch_running = False
+        self.task_qty = 0
+        self.sent_qty = 0
+        self.received_qty = 0
+        self.yielded_qty = 0
+        self.reorder_buffer = {}
+        self.generator = None
+        # timings (in seconds) of the task being loaded, filled by load_minibatch with add_timing_
+        self.timings = {}
+        self.statistics = {}
 
     def __enter__(self):
         self.init_processes()
@@ -30,63 +66,300 @@ class ParallelMinibatch:
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.stop_processes()
 
-    def init_processes(self):
+    def start_workers(self):
+        """
+        Fork the worker pool, workers stay alive across epochs until terminate_processes is called. Workers are forked
+        with the state of the object at that time (ex: data augmentation), only epoch_state_ is sent at each epoch.
+        :return:
+        """
         if self.processes:
-            raise Exception("init_processes is called but there are still running process!")
+            raise Exception("start_workers is called but there are still running process!")
         self.tasks = Queue()
-        self.results = Queue(self.max_size)
+        self.results = Queue(self.prefetch_qty_())
+        self.current_epoch = Value('i', -1, lock=False)
+        if self.shared_memory:
+            if self.slots is None:
+                self.slots = self.allocate_slots_()
+            self.free_slots = Queue()
+            for i in range(len(self.slots)):
+                self.free_slots.put(i)
+        self.processes = [Process(target=self.worker_, args=(self.results, self.tasks, self.free_slots,
+                                                             self.current_epoch))
+                          for i in range(self.N_Process)]
+        for proc in self.processes:
+            proc.daemon = True
+            proc.start()
 
-        self.minibatches_indexes = self.compute_minibatches_permutations_()
+    def init_processes(self, minibatches_indexes=None):
+        """
+        Start an epoch : queue the minibatches of a new permutation (or of the given list of tasks) to the workers
+        :param minibatches_indexes:
+        :return:
+        """
+        if self.epoch_running:
+            raise Exception("init_processes is called but the previous epoch is not stopped!")
+        if not self.processes:
+            self.start_workers()
+        self.epoch += 1
+        self.current_epoch.value = self.epoch
+        if minibatches_indexes is None:
+            minibatches_indexes = self.compute_minibatches_permutations_()
+        self.minibatches_indexes = minibatches_indexes
         self.task_qty = len(self.minibatches_indexes)
-        for task in self.minibatches_indexes:
-            self.tasks.put(task)
+        self.sent_qty = 0
+        self.received_qty = 0
+        self.yielded_qty = 0
+        self.epoch_state = self.epoch_state_()
+        self.reset_statistics_()
+        self.send_tasks_()
+        self.epoch_running = True
 
-        self.processes = [Process(target=self.worker_, args=(self.results, self.tasks)) for i in range(self.N_Process)]
-        for proc in self.processes:
-            proc.start()
+    def prefetch_qty_(self):
+        """
+        Number of minibatches loaded ahead of the consumer : max_size (or number of processes + 2) reduced to fit in
+        max_memory
+        :return:
+        """
+        prefetch_qty = self.buffer_size if self.buffer_size > 0 else self.N_Process + 2
+        if self.max_memory > 0:
+            minibatch_bytes = sum(int(np.prod(shape)) * np.dtype(dtype).itemsize
+                                  for shape, dtype in self.minibatch_buffers_())
+            prefetch_qty = max(1, min(prefetch_qty, self.max_memory // minibatch_bytes))
+        return prefetch_qty
+
+    def task_window_(self):
+        """
+        Maximum number of tasks sent to the workers and not yielded yet. It bounds the memory used by the loaded
+        minibatches, the reordering buffer and, with shared memory, makes sure the next task in order always finds a
+        free slot.
+        :return:
+        """
+        if self.shared_memory:
+            return len(self.slots)
+        return self.prefetch_qty_()
+
+    def send_tasks_(self):
+        window = self.task_window_()
+        while self.sent_qty < self.task_qty and self.sent_qty - self.yielded_qty < window:
+            task = self.minibatches_indexes[self.sent_qty]
+            self.tasks.put((self.epoch, self.sent_qty, task, self.epoch_state))
+            self.sent_qty += 1
+
+    def epoch_random_state_(self):
+        """
+        Random state of the current epoch, used to compute the permutations
+        :return:
+        """
+        if self.seed is None:
+            return np.random
+        return np.random.RandomState([self.seed, self.stream, self.epoch])
+
+    def task_random_state_(self, epoch, task_id):
+        """
+        Each task gets its own random state, seeded from the OS if no seed is given : forked workers do not share (or
+        replay) the random stream of the parent
+        :param epoch:
+        :param task_id:
+        :return:
+        """
+        if self.seed is None:
+            return np.random.RandomState()
+        return np.random.RandomState([self.seed, self.stream, epoch, task_id])
 
     def stop_processes(self):
+        """
+        Stop the current epoch, tasks that are still queued are cancelled. The workers are kept for the next epoch.
+        :return:
+        """
+        if not self.epoch_running:
+            raise Exception("stop_processes is called but there are no epoch running!")
+        if self.generator is not None:
+            self.generator.close()
+            self.generator = None
+        # workers skip the queued tasks of a cancelled epoch, but still answer each of them
+        self.current_epoch.value = -1
+        results = [result for result, timings in self.reorder_buffer.values()]
+        self.reorder_buffer = {}
+        while self.received_qty < self.sent_qty:
+            epoch, task_id, result, timings = self.results.get(block=True, timeout=None)
+            self.received_qty += 1
+            results.append(result)
+        if self.shared_memory:
+            for result in results:
+                if result is not None:
+                    self.free_slots.put(result[0])
+        self.task_qty = 0
+        self.epoch_running = False
+
+    def terminate_processes(self):
+        """
+        Shut down the worker pool
+        :return:
+        """
+        if self.epoch_running:
+            self.stop_processes()
         if not self.processes:
-            raise Exception("stop_processes is called but there are no process running!")
+            return
         for i in range(self.N_Process):
             self.tasks.put(None)
-        # todo implement a way to remove current task so we do not have to wait for all task to be completed
         for proc in self.processes:
             proc.join()
         self.tasks = None
         self.results = None
+        self.free_slots = None
+        self.current_epoch = None
         self.processes = []
 
-    def worker_(self, results, tasks):
+    def allocate_slots_(self):
+        """
+        Allocate the shared memory slots, one set of buffers per slot. They are allocated before the workers are
+        forked so every process maps the same memory.
+        :return:
+        """
+        slots = []
+        for i in range(self.prefetch_qty_()):
+            buffers = []
+            for shape, dtype in self.minibatch_buffers_():
+                dtype = np.dtype(dtype)
+                raw = RawArray('b', int(np.prod(shape)) * dtype.itemsize)
+                buffers.append(np.frombuffer(raw, dtype=dtype).reshape(shape))
+            slots.append(buffers)
+        return slots
+
+    def worker_(self, results, tasks, free_slots, current_epoch):
         while True:
-            task = tasks.get(block=True, timeout=None)
-            if task is None:
+            item = tasks.get(block=True, timeout=None)
+            if item is None:
                 break
-            batch = self.load_minibatch(task)
-            results.put(batch)
+            epoch, task_id, task, epoch_state = item
+            if epoch != current_epoch.value:
+                results.put((epoch, task_id, None, None))
+                continue
+            self.set_epoch_state_(epoch_state)
+            rng = self.task_random_state_(epoch, task_id)
+            self.timings = {}
+            if free_slots is None:
+                batch = self.load_minibatch(task, rng=rng)
+                results.put((epoch, task_id, batch, self.timings))
+            else:
+                slot = free_slots.get(block=True, timeout=None)
+                self.load_minibatch(task, [buffer[:len(task)] for buffer in self.slots[slot]], rng=rng)
+                results.put((epoch, task_id, (slot, len(task)), self.timings))
 
     def get_minibatch(self):
         """
         This function block until the next task is ready
         :return:
         """
-        if not self.processes:
+        if not self.epoch_running:
             raise Exception("init_processes before getting minibatches")
-        for i in range(self.task_qty):
-            result = self.results.get(block=True, timeout=None)
-            yield result
-        self.task_qty = 0
+        self.generator = self.minibatch_generator_()
+        return self.generator
+
+    def receive_(self):
+        """
+        Return the next result to yield, in task order if self.ordered
+        :return:
+        """
+        if not self.ordered:
+            epoch, task_id, result, timings = self.results.get(block=True, timeout=None)
+            self.received_qty += 1
+            return task_id, result, timings
+        while self.yielded_qty not in self.reorder_buffer:
+            epoch, task_id, result, timings = self.results.get(block=True, timeout=None)
+            self.received_qty += 1
+            self.reorder_buffer[task_id] = result, timings
+        task_id = self.yielded_qty
+        result, timings = self.reorder_buffer.pop(task_id)
+        return task_id, result, timings
+
+    def minibatch_generator_(self):
+        while self.yielded_qty < self.task_qty:
+            start_time = time.time()
+            task_id, result, timings = self.receive_()
+            self.update_statistics_(len(self.minibatches_indexes[task_id]), time.time() - start_time, timings)
+            self.yielded_qty += 1
+            if self.shared_memory:
+                slot, size = result
+                try:
+                    yield tuple(buffer[:size] for buffer in self.slots[slot])
+                finally:
+                    # the consumer asked for the next minibatch (or stopped) : the slot can be reused
+                    self.free_slots.put(slot)
+            else:
+                yield result
+            self.send_tasks_()
+
+    def add_timing_(self, name, start_time):
+        """
+        Called by load_minibatch in the workers : add the time elapsed since start_time to the timing name of the task
+        :param name:
+        :param start_time:
+        :return: current time, to chain the measures
+        """
+        end_time = time.time()
+        self.timings[name] = self.timings.get(name, 0.) + end_time - start_time
+        return end_time
+
+    def reset_statistics_(self):
+        self.statistics = {"minibatch_qty": 0, "sample_qty": 0, "start_time": time.time(), "timings": {}}
+
+    def update_statistics_(self, sample_qty, queue_wait, timings):
+        self.statistics["minibatch_qty"] += 1
+        self.statistics["sample_qty"] += sample_qty
+        totals = self.statistics["timings"]
+        totals["queue_wait"] = totals.get("queue_wait", 0.) + queue_wait
+        for name, value in timings.items():
+            totals[name] = totals.get(name, 0.) + value
+
+    def get_statistics(self):
+        """
+        Loader telemetry of the current (or last) epoch : mean time per minibatch in seconds of each timing (queue_wait
+        is the time the consumer waited for a minibatch, the others are measured in the workers) and the samples
+        delivered per second. A queue_wait close to zero means the consumer is not starved by the loaders.
+        :return: dict
+        """
+        minibatch_qty = max(self.statistics.get("minibatch_qty", 0), 1)
+        statistics = {name: value / minibatch_qty for name, value in self.statistics.get("timings", {}).items()}
+        elapsed_time = time.time() - self.statistics.get("start_time", time.time())
+        statistics["samples_per_sec"] = self.statistics.get("sample_qty", 0) / elapsed_time if elapsed_time > 0 else 0.
+        return statistics
+
+    def epoch_state_(self):
+        """
+        Picklable state sent to the workers at each epoch (the workers are forked only once)
+        :return:
+        """
+        return None
+
+    def set_epoch_state_(self, state):
+        """
+        Called in the worker with the epoch_state_ of the task's epoch
+        :param state:
+        :return:
+        """
+        pass
 
     @abc.abstractmethod
-    def load_minibatch(self, task):
+    def load_minibatch(self, task, buffers=None, rng=None):
         """
         User implementation of minibatch load code. Task is a task given to input_tasks previously, return the minibatch
         the object will make sure to pass it safely to the consumer
         :param task:
+        :param buffers: preallocated buffers (see minibatch_buffers_) to fill in place, allocate them if None
+        :param rng: np.random.RandomState to use for every random operation of the task
         :return:
         """
         return
 
+    def minibatch_buffers_(self):
+        """
+        User implementation of the minibatch buffers layout, needed for shared memory transport. It should return a
+        list of (shape, dtype) for a full minibatch : [((64, 3, 100, 100), np.float32), ((64, 6), np.float32)]
+        :return:
+        """
+        raise NotImplementedError("minibatch_buffers_ must be implemented to use shared memory")
+
     @abc.abstractmethod
     def compute_minibatches_permutations_(self):
         """
@@ -98,7 +371,7 @@ class ParallelMinibatch:
 
 
 class ExempleMinibatchLoader(ParallelMinibatch):
-    def load_minibatch(self, task):
+    def load_minibatch(self, task, buffers=None, rng=None):
         """
         Simple exemple implementation of loading/worker code
         :param task:
@@ -135,7 +408,7 @@ if __name__ == '__main__':
 
     # This is the actual use of Parallel loading split on N processes.
     start_time = time.time()
-    # here you can use with to start/end processes or use init_processes and stop_processes
+    # here you can use with to start/end an epoch or use init_processes and stop_processes
     with loader:
         # retrieve the minibatch generator
         minibatches = loader.get_minibatch()
@@ -145,3 +418,5 @@ if __name__ == '__main__':
             pass
 
     print("Parallel : {}".format(time.time() - start_time))
+    # the workers are kept alive for the next epochs until they are terminated
+    loader.terminate_processes()
@@ -0,0 +1,250 @@
+"""
+    Columnar storage of a dataset's poses : a N x 6 float32 array of viewpoint parameters, a M x 6 float32 array of
+    pair parameters and the pair count of each viewpoint. The whole index is saved in a single viewpoints.npz file and
+    Transforms are only built when a pose is requested.
+
+    Samples written between two saves of the index are appended to viewpoints.journal (see PoseJournal).
+"""
+
+import os
+import threading
+import numpy as np
+from deeptracking.utils.transform import Transform
+
+
+def grow_array(array, size):
+    """
+    Return an array with at least size rows that starts with the content of array (amortized doubling)
+    :param array:
+    :param size:
+    :return:
+    """
+    if size <= len(array):
+        return array
+    new_array = np.zeros((max(size, 2 * len(array), 16),) + array.shape[1:], dtype=array.dtype)
+    new_array[:len(array)] = array
+    return new_array
+
+
+class PoseIndex:
+    FILE = "viewpoints.npz"
+
+    def __init__(self):
+        self.pose_qty = 0
+        self.pair_qty = 0
+        self.poses = np.zeros((0, 6), dtype=np.float32)
+        self.pair_counts = np.zeros(0, dtype=np.int32)
+        self.pairs = np.zeros((0, 6), dtype=np.float32)
+        self.pair_owners = np.zeros(0, dtype=np.int32)
+        # pair rows sorted by viewpoint, recomputed only when pairs are added out of order
+        self.pair_order = None
+        self.pair_offsets = None
+
+    def size(self):
+        return self.pose_qty
+
+    def pair_size(self, index):
+        if index >= self.pose_qty:
+            return 0
+        return int(self.pair_counts[index])
+
+    def add_pose(self, parameters):
+        index = self.pose_qty
+        self.poses = grow_array(self.poses, index + 1)
+        self.pair_counts = grow_array(self.pair_counts, index + 1)
+        self.poses[index] = parameters
+        self.pose_qty += 1
+        self.pair_offsets = None
+        return index
+
+    def set_pose(self, index, parameters):
+        if index >= self.pose_qty:
+            raise IndexError("pose {} does not exists".format(index))
+        self.poses[index] = parameters
+
+    def add_pair(self, index, parameters):
+        if index >= self.pose_qty:
+            raise IndexError("impossible to add pair if pose does not exists")
+        row = self.pair_qty
+        self.pairs = grow_array(self.pairs, row + 1)
+        self.pair_owners = grow_array(self.pair_owners, row + 1)
+        self.pairs[row] = parameters
+        self.pair_owners[row] = index
+        self.pair_qty += 1
+        pair_id = int(self.pair_counts[index])
+        self.pair_counts[index] += 1
+        self.pair_order = None
+        self.pair_offsets = None
+        return pair_id
+
+    def pose_parameters(self, index):
+        if index >= self.pose_qty:
+            raise IndexError("pose {} does not exists".format(index))
+        return self.poses[index]
+
+    def pair_parameters(self, index, pair_id):
+        if pair_id >= self.pair_size(index):
+            raise IndexError("pair {} of pose {} does not exists".format(pair_id, index))
+        return self.pairs[self.pair_row_(index, pair_id)]
+
+    def pose(self, index):
+        return Transform.from_parameters(*self.pose_parameters(index))
+
+    def pair(self, index, pair_id):
+        return Transform.from_parameters(*self.pair_parameters(index, pair_id))
+
+    def pair_row_(self, index, pair_id):
+        if self.pair_order is None:
+            self.pair_order = np.argsort(self.pair_owners[:self.pair_qty], kind="mergesort")
+        if self.pair_offsets is None:
+            self.pair_offsets = np.zeros(self.pose_qty + 1, dtype=np.int64)
+            np.cumsum(self.pair_counts[:self.pose_qty], out=self.pair_offsets[1:])
+        return self.pair_order[self.pair_offsets[index] + pair_id]
+
+    def sorted_pairs_(self):
+        if self.pair_order is None:
+            self.pair_order = np.argsort(self.pair_owners[:self.pair_qty], kind="mergesort")
+        return self.pairs[self.pair_order]
+
+    def save(self, path):
+        """
+        Write the index in one viewpoints.npz file, pairs are stored grouped by viewpoint
+        :param path:
+        :return:
+        """
+        file_path = os.path.join(path, self.FILE)
+        with open(file_path + ".tmp", 'wb') as outfile:
+            np.savez(outfile,
+                     poses=self.poses[:self.pose_qty],
+                     pair_counts=self.pair_counts[:self.pose_qty],
+                     pairs=self.sorted_pairs_())
+        os.replace(file_path + ".tmp", file_path)
+
+    @staticmethod
+    def exists(path):
+        return os.path.exists(os.path.join(path, PoseIndex.FILE))
+
+    def sample_records(self, index):
+        """
+        Journal records of a viewpoint and its pairs
+        :param index:
+        :return:
+        """
+        pair_qty = self.pair_size(index)
+        records = np.zeros(pair_qty + 1, dtype=PoseJournal.DTYPE)
+        records["index"] = index
+        records["pair"][0] = -1
+        records["parameters"][0] = self.pose_parameters(index)
+        for pair_id in range(pair_qty):
+            records["pair"][pair_id + 1] = pair_id
+            records["parameters"][pair_id + 1] = self.pair_parameters(index, pair_id)
+        return records
+
+    def replay(self, records):
+        """
+        Add the samples of journal records that follow the index. Samples are journaled in completion order : only the
+        samples that follow the index without gap are added, with all their pairs.
+        :param records:
+        :return: number of samples added
+        """
+        records = records[records["index"] >= self.pose_qty]
+        records = records[np.lexsort((records["pair"], records["index"]))]
+        starts = np.flatnonzero(np.diff(records["index"], prepend=-1))
+        ends = np.append(starts[1:], len(records))
+        added = 0
+        for start, end in zip(starts, ends):
+            sample = records[start:end]
+            # a sample journaled twice (written again) : keep one record per pair
+            sample = sample[np.append(np.diff(sample["pair"]) != 0, True)]
+            if sample["index"][0] != self.pose_qty or sample["pair"][0] != -1 or \
+                    not np.array_equal(sample["pair"][1:], np.arange(len(sample) - 1)):
+                break
+            index = self.add_pose(sample["parameters"][0])
+            for parameters in sample["parameters"][1:]:
+                self.add_pair(index, parameters)
+            added += 1
+        return added
+
+    @staticmethod
+    def from_arrays(poses, pair_counts, pairs):
+        index = PoseIndex()
+        index.pose_qty = len(poses)
+        index.pair_qty = len(pairs)
+        index.poses = np.ascontiguousarray(poses, dtype=np.float32).reshape(-1, 6)
+        index.pair_counts = np.ascontiguousarray(pair_counts, dtype=np.int32)
+        index.pairs = np.ascontiguousarray(pairs, dtype=np.float32).reshape(-1, 6)
+        index.pair_owners = np.repeat(np.arange(index.pose_qty, dtype=np.int32), index.pair_counts)
+        index.pair_order = np.arange(index.pair_qty)
+        return index
+
+    @staticmethod
+    def load(path):
+        with np.load(os.path.join(path, PoseIndex.FILE)) as data:
+            return PoseIndex.from_arrays(data["poses"], data["pair_counts"], data["pairs"])
+
+    @staticmethod
+    def from_json(data):
+        """
+        Build the index from the legacy viewpoints.json dictionary (one dict of stringified parameters per pose)
+        :param data:
+        :return:
+        """
+        poses = []
+        pair_counts = []
+        pairs = []
+        while str(len(poses)) in data:
+            id = str(len(poses))
+            poses.append([float(data[id]["vector"][str(x)]) for x in range(6)])
+            pair_qty = int(data[id].get("pairs", 0))
+            for i in range(pair_qty):
+                pair_id = "{}n{}".format(id, i)
+                pairs.append([float(data[pair_id]["vector"][str(x)]) for x in range(6)])
+            pair_counts.append(pair_qty)
+        return PoseIndex.from_arrays(np.array(poses, dtype=np.float32),
+                                     np.array(pair_counts, dtype=np.int32),
+                                     np.array(pairs, dtype=np.float32))
+
+
+class PoseJournal:
+    """
+    Append-only file of the samples (one record per viewpoint and per pair) written since the index was saved. A
+    record is appended once the frames of its sample are on disk, an interrupted run loses at most the samples that
+    were being written.
+    """
+    FILE = "viewpoints.journal"
+    DTYPE = np.dtype([("index", "<i4"), ("pair", "<i4"), ("parameters", "<f4", (6,))])
+
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+        # records are appended by the completion callbacks of the background writer
+        self.lock = threading.Lock()
+
+    def append(self, records):
+        with self.lock:
+            if self.file is None:
+                self.file = open(os.path.join(self.path, self.FILE), 'ab')
+            self.file.write(records.tobytes())
+            self.file.flush()
+
+    def clear(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+            open(os.path.join(self.path, self.FILE), 'wb').close()
+
+    @staticmethod
+    def read(path):
+        """
+        Records of the journal of a folder, a truncated last record is ignored
+        :param path:
+        :return:
+        """
+        file_path = os.path.join(path, PoseJournal.FILE)
+        if not os.path.exists(file_path):
+            return np.zeros(0, dtype=PoseJournal.DTYPE)
+        with open(file_path, 'rb') as journal:
+            data = journal.read()
+        record_qty = len(data) // PoseJournal.DTYPE.itemsize
+        return np.frombuffer(data[:record_qty * PoseJournal.DTYPE.itemsize], dtype=PoseJournal.DTYPE)
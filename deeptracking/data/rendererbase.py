@@ -0,0 +1,95 @@
+"""
+    Camera projection shared by the renderers (ModelRenderer with opengl, NumpyRenderer on the cpu) : both use the
+    same projection matrix. NumpyRenderer converts its depth buffer to millimeters with gldepth_to_worlddepth, the
+    shaders of ModelRenderer write the depth in millimeters directly.
+"""
+
+import numpy as np
+
+
+class RendererBase:
+    near_plane = 0.1
+    far_plane = 2
+
+    def setup_camera(self, camera, left, right, bottom, top):
+        # credit : http://ksimek.github.io/2013/06/03/calibrated_cameras_in_opengl/
+        proj = np.array([[camera.focal_x, 0, -camera.center_x, 0],
+                         [0, camera.focal_y, -camera.center_y, 0],
+                         [0, 0, self.near_plane + self.far_plane, self.near_plane * self.far_plane],
+                         [0, 0, -1, 0]])
+        # transposed : uploaded as is in a column major opengl uniform
+        self.projection_matrix = RendererBase.orthographicMatrix(left,
+                                                                 right,
+                                                                 bottom,
+                                                                 top,
+                                                                 self.near_plane,
+                                                                 self.far_plane).dot(proj).T
+
+    def setup_crop(self, camera, boundingbox):
+        """
+        Render only the crop of the camera image inside the bounding box, scaled to the render size
+        :param camera:
+        :param boundingbox: see compute_2Dboundingbox, computed with scale=(1000, 1000, -1000)
+        :return:
+        """
+        left = np.min(boundingbox[:, 1])
+        right = np.max(boundingbox[:, 1])
+        top = np.min(boundingbox[:, 0])
+        bottom = np.max(boundingbox[:, 0])
+        self.setup_camera(camera, left, right, bottom, top)
+
+    @staticmethod
+    def orthographicMatrix(left, right, bottom, top, near, far):
+        right = float(right)
+        left = float(left)
+        top = float(top)
+        bottom = float(bottom)
+        mat = np.array([[2. / (right - left), 0, 0, -(right + left) / (right - left)],
+                        [0, 2. / (top - bottom), 0, -(top + bottom) / (top - bottom)],
+                        [0, 0, -2 / (far - near), -(far + near) / (far - near)],
+                        [0, 0, 0, 1]], dtype=np.float32)
+        return mat
+
+    def render_async(self, view_transform, light_direction=None, light_diffuse=None):
+        """
+        Start a render, its images are returned by read. Renderers without asynchronous readback render here.
+        :param view_transform:
+        :param light_direction:
+        :param light_diffuse:
+        :return: handle of the render
+        """
+        return self.render(view_transform, light_direction, light_diffuse)
+
+    def read(self, render):
+        """
+        :param render: handle returned by render_async
+        :return: rgb and depth images
+        """
+        return render
+
+    def render_batch(self, view_transforms, light_directions=None, light_diffuses=None):
+        """
+        Render many poses with the current camera
+        :param view_transforms: list of view transforms
+        :param light_directions: list (None for the default direction), same length as view_transforms
+        :param light_diffuses: list (None for the default diffuse), same length as view_transforms
+        :return: rgb (N, height, width, 3) and depth (N, height, width) images
+        """
+        if light_directions is None:
+            light_directions = [None] * len(view_transforms)
+        if light_diffuses is None:
+            light_diffuses = [None] * len(view_transforms)
+        width, height = self.window_size
+        rgb = np.empty((len(view_transforms), height, width, 3), dtype=np.uint8)
+        depth = np.empty((len(view_transforms), height, width), dtype=np.uint16)
+        for i, view_transform in enumerate(view_transforms):
+            rgb[i], depth[i] = self.render(view_transform, light_directions[i], light_diffuses[i])
+        return rgb, depth
+
+    def gldepth_to_worlddepth(self, frame):
+        A = self.projection_matrix[2, 2]
+        B = self.projection_matrix[3, 2]
+        distance = B / (frame * -2.0 + 1.0 - A) * -1
+        idx = distance[:, :] >= B / (A + 1)
+        distance[idx] = 0
+        return (distance * 1000).astype(np.uint16)
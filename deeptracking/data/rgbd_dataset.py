@@ -37,8 +37,10 @@ class RGBDDataset():
         depth = np.array(Image.open(os.path.join(directory, img + "d.png"))).astype(np.uint16)
         return color, depth
 
-    def load_random_sample(self):
-        rand_int = random.randint(0, len(self.indexes_list) - 1)
+    def load_random_sample(self, rng=None):
+        if rng is None:
+            rng = np.random
+        rand_int = rng.randint(0, len(self.indexes_list))
         if self.do_preload:
             color, depth = self.preloaded[rand_int]
         else:
@@ -46,9 +48,16 @@ class RGBDDataset():
             color, depth = self.load_sample(dir, file)
         return color, depth
 
-    def load_random_image(self, size):
-        color, depth = self.load_random_sample()
-        x, y = RGBDDataset.get_random_crop(color.shape[0], color.shape[1], size)
+    def load_random_image(self, size, rng=None):
+        """
+        :param size:
+        :param rng: np.random.RandomState used for the random draws (np.random if None)
+        :return:
+        """
+        if rng is None:
+            rng = np.random
+        color, depth = self.load_random_sample(rng)
+        x, y = RGBDDataset.get_random_crop(color.shape[0], color.shape[1], size, rng)
         color = color[x:x+size, y:y+size, :]
         depth = depth[x:x+size, y:y+size]
         return color, depth
@@ -61,8 +70,10 @@ class RGBDDataset():
         return sequence
 
     @staticmethod
-    def get_random_crop(w, h, size):
-        x = random.randint(0, w - size)
-        y = random.randint(0, h - size)
+    def get_random_crop(w, h, size, rng=None):
+        if rng is None:
+            rng = np.random
+        x = rng.randint(0, w - size + 1)
+        y = rng.randint(0, h - size + 1)
         return x, y
 
@@ -0,0 +1,91 @@
+"""
+    Bounded cache of decoded frames in shared memory, with least recently used eviction. The cache is allocated before
+    the ParallelMinibatch workers are forked : every worker reads and fills the same memory, so after the first epoch
+    the cached frames are not decoded again by any worker.
+
+    Frames are identified by an integer key in [0, key_qty) and stored as fixed size records (see frame_record_dtype).
+"""
+
+import numpy as np
+from multiprocessing import Lock
+from multiprocessing.sharedctypes import RawArray
+from deeptracking.data.shardstorage import frame_record_dtype
+
+
+def shared_array(qty, dtype, value):
+    dtype = np.dtype(dtype)
+    array = np.frombuffer(RawArray('b', max(qty, 1) * dtype.itemsize), dtype=dtype)[:qty]
+    array[:] = value
+    return array
+
+
+class SampleCache:
+    def __init__(self, max_bytes, key_qty, height, width):
+        """
+        :param max_bytes: memory budget of the cached frames
+        :param key_qty: number of frames that can be cached (keys are 0 to key_qty - 1)
+        :param height:
+        :param width:
+        """
+        self.shape = (height, width)
+        self.dtype = frame_record_dtype(height, width)
+        self.key_qty = key_qty
+        self.slot_qty = int(min(max_bytes // self.dtype.itemsize, key_qty))
+        self.records = np.frombuffer(RawArray('b', max(self.slot_qty, 1) * self.dtype.itemsize),
+                                     dtype=self.dtype)[:self.slot_qty]
+        self.key_slots = shared_array(key_qty, np.int32, -1)
+        self.slot_keys = shared_array(self.slot_qty, np.int32, -1)
+        # last access time of each slot, the slot with the smallest tick is evicted
+        self.slot_ticks = shared_array(self.slot_qty, np.int64, 0)
+        # [clock, used slots, hits, misses]
+        self.counters = shared_array(4, np.int64, 0)
+        self.lock = Lock()
+
+    def __len__(self):
+        return int(self.counters[1])
+
+    def get(self, key):
+        """
+        Return a copy of the cached rgb and depth of key, or None
+        :param key:
+        :return:
+        """
+        if key >= self.key_qty or self.slot_qty == 0:
+            return None
+        with self.lock:
+            slot = self.key_slots[key]
+            if slot < 0:
+                self.counters[3] += 1
+                return None
+            self.counters[0] += 1
+            self.counters[2] += 1
+            self.slot_ticks[slot] = self.counters[0]
+            # copy while locked : the slot can be reused as soon as the lock is released
+            return self.records["rgb"][slot].copy(), self.records["depth"][slot].copy()
+
+    def put(self, key, rgb, depth):
+        if key >= self.key_qty or self.slot_qty == 0 or depth.shape[:2] != self.shape:
+            return
+        with self.lock:
+            if self.key_slots[key] >= 0:
+                return
+            if self.counters[1] < self.slot_qty:
+                slot = self.counters[1]
+                self.counters[1] += 1
+            else:
+                slot = int(np.argmin(self.slot_ticks))
+                self.key_slots[self.slot_keys[slot]] = -1
+            self.counters[0] += 1
+            self.slot_ticks[slot] = self.counters[0]
+            self.slot_keys[slot] = key
+            self.key_slots[key] = slot
+            self.records["rgb"][slot] = rgb
+            # keep the bits of signed depth images (see Frame.depth_dtype)
+            self.records["depth"][slot] = depth.view(np.uint16) if depth.dtype == np.int16 else depth
+
+    def get_statistics(self):
+        """
+        :return: dict with the number of cached frames, hits and misses
+        """
+        return {"size": int(self.counters[1]), "capacity": self.slot_qty, "hits": int(self.counters[2]),
+                "misses": int(self.counters[3])}
@@ -0,0 +1,209 @@
+"""
+    Packs fixed size rgb/depth frames in large binary shard files. Each record holds a uint8 rgb plane and a uint16
+    depth plane, records are read back through np.memmap so a frame is a zero-copy slice of the shard.
+
+    Layout of a storage folder :
+        shards.json         : frame shape, records per shard and the ordered list of frame ids (offset index)
+        shards.journal      : ids appended since shards.json was last saved, one per line
+        shard_XXXX.bin      : raw records, record k of the storage is record k % shard_size of shard k // shard_size
+"""
+
+import json
+import os
+import numpy as np
+
+
+def frame_record_dtype(height, width):
+    """
+    Structured dtype of one frame : rgb as uint8 (h, w, 3) and depth as native little endian uint16 (h, w)
+    :param height:
+    :param width:
+    :return:
+    """
+    return np.dtype([("rgb", np.uint8, (height, width, 3)), ("depth", "<u2", (height, width))])
+
+
+def read_journal_lines(path):
+    """
+    Lines of a journal file, a last line without line end (interrupted write) is ignored
+    :param path:
+    :return:
+    """
+    if not os.path.exists(path):
+        return []
+    with open(path) as journal:
+        lines = journal.read().split("\n")
+    return lines[:-1]
+
+
+def append_journal_lines(path, lines):
+    with open(path, 'a') as journal:
+        journal.write("".join(line + "\n" for line in lines))
+
+
+class ShardStorage:
+    INDEX_FILE = "shards.json"
+    JOURNAL_FILE = "shards.journal"
+    SHARD_FILE = "shard_{:04d}.bin"
+
+    # one storage per folder and per process
+    storages = {}
+
+    def __init__(self, path, shard_size=4096):
+        self.path = path
+        self.shard_size = shard_size
+        self.shape = None
+        self.dtype = None
+        self.ids = []
+        self.offsets = {}
+        self.maps = {}
+        self.writer = None
+        self.writer_shard = None
+        self.dirty = False
+        # number of ids saved in the index or the journal, and in the index only
+        self.saved_qty = 0
+        self.indexed_qty = 0
+        self.load_index()
+
+    @staticmethod
+    def open(path):
+        key = os.path.abspath(path)
+        if key not in ShardStorage.storages:
+            ShardStorage.storages[key] = ShardStorage(path)
+        return ShardStorage.storages[key]
+
+    @staticmethod
+    def close(path):
+        """
+        Forget the storage of a folder in this process (files are closed, nothing is saved)
+        :param path:
+        :return:
+        """
+        storage = ShardStorage.storages.pop(os.path.abspath(path), None)
+        if storage is not None and storage.writer is not None:
+            storage.writer.close()
+
+    def load_index(self):
+        index_path = os.path.join(self.path, self.INDEX_FILE)
+        if not os.path.exists(index_path):
+            return
+        with open(index_path) as data_file:
+            data = json.load(data_file)
+        self.shard_size = int(data["shard_size"])
+        self.set_shape(int(data["height"]), int(data["width"]))
+        self.ids = data["ids"] + read_journal_lines(os.path.join(self.path, self.JOURNAL_FILE))
+        self.offsets = {id: i for i, id in enumerate(self.ids)}
+        self.saved_qty = len(self.ids)
+        self.indexed_qty = len(data["ids"])
+
+    def save_index(self):
+        """
+        Save the whole index and clear the journal
+        :return:
+        """
+        # ids flushed since the last save are only in the journal
+        if self.shape is None or (self.indexed_qty == len(self.ids) and
+                                  os.path.exists(os.path.join(self.path, self.INDEX_FILE))):
+            return
+        if self.writer is not None:
+            self.writer.flush()
+        data = {"height": self.shape[0], "width": self.shape[1], "shard_size": self.shard_size, "ids": self.ids}
+        index_path = os.path.join(self.path, self.INDEX_FILE)
+        with open(index_path + ".tmp", 'w') as outfile:
+            json.dump(data, outfile)
+        os.replace(index_path + ".tmp", index_path)
+        open(os.path.join(self.path, self.JOURNAL_FILE), 'w').close()
+        self.saved_qty = len(self.ids)
+        self.indexed_qty = len(self.ids)
+        self.dirty = False
+
+    def flush(self):
+        """
+        Make the frames written so far readable by other processes : the records are flushed and only their ids are
+        appended to the journal (the first flush saves the index)
+        :return:
+        """
+        if not self.dirty:
+            return
+        if not os.path.exists(os.path.join(self.path, self.INDEX_FILE)):
+            self.save_index()
+            return
+        if self.writer is not None:
+            self.writer.flush()
+        append_journal_lines(os.path.join(self.path, self.JOURNAL_FILE), self.ids[self.saved_qty:])
+        self.saved_qty = len(self.ids)
+        self.dirty = False
+
+    def set_shape(self, height, width):
+        self.shape = (height, width)
+        self.dtype = frame_record_dtype(height, width)
+
+    def shard_path(self, shard):
+        return os.path.join(self.path, self.SHARD_FILE.format(shard))
+
+    def __contains__(self, id):
+        return id in self.offsets
+
+    def saved(self, id):
+        """
+        :param id:
+        :return: True if the frame is in the index or the journal
+        """
+        return id in self.offsets and self.offsets[id] < self.saved_qty
+
+    def __len__(self):
+        return len(self.ids)
+
+    def write(self, id, rgb, depth):
+        if self.shape is None:
+            self.set_shape(*depth.shape[:2])
+        if depth.shape[:2] != self.shape:
+            raise ValueError("Frame {} has shape {}, storage {} only holds frames of shape {}".format(id, depth.shape,
+                                                                                                 self.path, self.shape))
+        record = np.empty((), dtype=self.dtype)
+        record["rgb"] = rgb
+        record["depth"] = depth
+        if id in self.offsets:
+            self.overwrite_(self.offsets[id], record)
+            return
+        offset = len(self.ids)
+        shard = offset // self.shard_size
+        if self.writer_shard != shard:
+            if self.writer is not None:
+                self.writer.close()
+            # records written after the last flush of an interrupted run are not in the index : drop them
+            record_qty = offset - shard * self.shard_size
+            if os.path.exists(self.shard_path(shard)) and \
+                    os.path.getsize(self.shard_path(shard)) > record_qty * self.dtype.itemsize:
+                os.truncate(self.shard_path(shard), record_qty * self.dtype.itemsize)
+            self.writer = open(self.shard_path(shard), 'ab')
+            self.writer_shard = shard
+        self.writer.write(record.tobytes())
+        self.ids.append(id)
+        self.offsets[id] = offset
+        self.dirty = True
+
+    def overwrite_(self, offset, record):
+        if self.writer is not None:
+            self.writer.flush()
+        shard, position = divmod(offset, self.shard_size)
+        with open(self.shard_path(shard), 'r+b') as shard_file:
+            shard_file.seek(position * self.dtype.itemsize)
+            shard_file.write(record.tobytes())
+        self.maps.pop(shard, None)
+
+    def read(self, id):
+        """
+        Return views on the rgb and depth planes of a frame. The shard is mapped copy-on-write : callers can modify
+        the arrays in place without touching the file.
+        :param id:
+        :return:
+        """
+        shard, position = divmod(self.offsets[id], self.shard_size)
+        shard_map = self.maps.get(shard)
+        if shard_map is None or position >= len(shard_map):
+            if self.writer is not None:
+                self.writer.flush()
+            shard_map = np.memmap(self.shard_path(shard), dtype=self.dtype, mode='c')
+            self.maps[shard] = shard_map
+        return shard_map["rgb"][position], shard_map["depth"][position]
@@ -58,13 +58,17 @@ class DeepTracker(TrackerBase):
         self.tracker_model.set_configs(configs)
 
     def compute_render(self, previous_pose, bb):
-        left = np.min(bb[:, 1])
-        right = np.max(bb[:, 1])
-        top = np.min(bb[:, 0])
-        bottom = np.max(bb[:, 0])
-        self.renderer.setup_camera(self.camera, left, right, bottom, top)
-        render_rgb, render_depth = self.renderer.render(previous_pose.transpose())
-        return render_rgb, render_depth
+        return self.renderer.read(self.start_render(previous_pose, bb))
+
+    def start_render(self, previous_pose, bb):
+        """
+        Render the crop of the previous pose (image_size), the pixels are read back while the caller keeps working
+        :param previous_pose:
+        :param bb:
+        :return: handle of the render, see ModelRenderer.read
+        """
+        self.renderer.setup_crop(self.camera, bb)
+        return self.renderer.render_async(previous_pose.transpose())
 
     def estimate_current_pose(self, previous_pose, current_rgb, current_depth, debug=False, debug_time=False):
         if debug_time:
@@ -74,11 +78,13 @@ class DeepTracker(TrackerBase):
         if debug_time:
             print("Compute BB : {}".format(time.time() - start_time))
             start_time = time.time()
-        rgbA, depthA = self.compute_render(previous_pose, bb)
+        render = self.start_render(previous_pose, bb)
+        # the current frame is cropped while the render is read back
+        rgbB, depthB = normalize_scale(current_rgb, current_depth, bb2, self.camera, self.image_size)
+        rgbA, depthA = self.renderer.read(render)
         if debug_time:
-            print("Render : {}".format(time.time() - start_time))
+            print("Render and crop : {}".format(time.time() - start_time))
             start_time = time.time()
-        rgbB, depthB = normalize_scale(current_rgb, current_depth, bb2, self.camera, self.image_size)
         debug_info = (rgbA, bb2, np.hstack((rgbA, rgbB)))
 
         rgbA = rgbA.astype(np.float)
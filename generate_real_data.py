@@ -107,6 +107,8 @@ if __name__ == '__main__':
     real_dataset.camera = camera
     output_dataset = Dataset(OUTPUT_PATH, frame_class=data["save_type"])
     output_dataset.camera = camera
+    # frames are encoded and written in the background while the next samples are rendered
+    output_dataset.set_async_writer(int(data.get("writer_processes", "4")))
     window_size = (real_dataset.camera.width, real_dataset.camera.height)
     window = InitOpenGL(*window_size)
 
@@ -125,6 +127,8 @@ if __name__ == '__main__':
         metadata["object_width"][model["name"]] = str(model["object_width"])
     metadata["min_radius"] = str(SPHERE_MIN_RADIUS)
     metadata["max_radius"] = str(SPHERE_MAX_RADIUS)
+    # metadata and camera are saved once, then each written sample is appended to the pose journal
+    output_dataset.save_json_files(metadata)
     for i in range(real_dataset.size()):
         frame, pose = real_dataset.data_pose[i]
 
@@ -132,6 +136,7 @@ if __name__ == '__main__':
         rgb, depth = frame.get_rgb_depth(real_dataset.path)
         masked_rgb, masked_depth = mask_real_image(rgb, depth, depth_render)
 
+        samples = []
         for j in range(SAMPLE_QUANTITY):
             rotated_rgb, rotated_depth, rotated_pose = random_z_rotation(masked_rgb, masked_depth, pose, real_dataset.camera)
             random_transform = Transform.random((-TRANSLATION_RANGE, TRANSLATION_RANGE),
@@ -140,8 +145,12 @@ if __name__ == '__main__':
 
             previous_pose = rotated_pose.copy()
             previous_pose = combine_view_transform(previous_pose, inverted_random_transform)
+            samples.append((rotated_rgb, rotated_depth, previous_pose, random_transform))
 
-            rgbA, depthA = vpRender.render(previous_pose.transpose())
+        # the previous poses of the frame are rendered in one batch
+        renders_rgb, renders_depth = vpRender.render_batch([sample[2].transpose() for sample in samples])
+        for j, (rotated_rgb, rotated_depth, previous_pose, random_transform) in enumerate(samples):
+            rgbA, depthA = renders_rgb[j], renders_depth[j]
             bb = compute_2Dboundingbox(previous_pose, real_dataset.camera, OBJECT_WIDTH, scale=(1000, -1000, -1000))
             rgbA, depthA = normalize_scale(rgbA, depthA, bb, real_dataset.camera, IMAGE_SIZE)
             rgbB, depthB = normalize_scale(rotated_rgb, rotated_depth, bb, real_dataset.camera, IMAGE_SIZE)
@@ -152,10 +161,7 @@ if __name__ == '__main__':
             sys.stdout.write("Progress: %d%%   \r" % (int(iteration / (SAMPLE_QUANTITY * real_dataset.size()) * 100)))
             sys.stdout.flush()
 
-            if iteration % 500 == 0:
-                output_dataset.dump_images_on_disk()
-            if iteration % 5000 == 0:
-                output_dataset.save_json_files(metadata)
+            output_dataset.dump_images_on_disk()
 
             if args.verbose:
                 show_frames(rgbA, depthA, rgbB, depthB)
@@ -166,3 +172,4 @@ if __name__ == '__main__':
 
     output_dataset.dump_images_on_disk()
     output_dataset.save_json_files(metadata)
+    output_dataset.close()
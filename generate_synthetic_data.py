@@ -2,16 +2,138 @@ from deeptracking.utils.argumentparser import ArgumentParser
 from deeptracking.utils.camera import Camera
 from deeptracking.utils.transform import Transform
 from deeptracking.data.dataset import Dataset
-from deeptracking.data.dataset_utils import combine_view_transform, show_frames, compute_2Dboundingbox, normalize_scale
-from deeptracking.data.modelrenderer import ModelRenderer, InitOpenGL
+from deeptracking.data.dataset_utils import combine_view_transform, show_frames, compute_2Dboundingbox
+from deeptracking.data.numpyrenderer import NumpyRenderer
 from deeptracking.utils.uniform_sphere_sampler import UniformSphereSampler
 from tqdm import tqdm
+import multiprocessing
+import numpy as np
+import random
+import shutil
 import sys
 import json
 import os
 import math
 import cv2
 ESCAPE_KEY = 1048603
+WORKER_FOLDER = "worker_{:02d}"
+
+
+def init_renderer(data, width, height):
+    """
+    Renderer class and context of the process : ModelRenderer with an opengl context, or NumpyRenderer (cpu, opengl
+    is not needed) if the renderer of the config is "numpy"
+    :param data: generation config
+    :param width:
+    :param height:
+    :return:
+    """
+    if data.get("renderer", "opengl") == "numpy":
+        return NumpyRenderer, None
+    # opengl is only imported when it is used
+    from deeptracking.data.modelrenderer import ModelRenderer, InitOpenGL
+    return ModelRenderer, InitOpenGL(width, height)
+
+
+def render_samples(data, dataset, start, end, renderer_class, window, show=False, verbose=False, position=0):
+    """
+    Render the samples start to end - 1 of the generation in dataset : sample i is a view of the model
+    i // sample_quantity of the config
+    :param data: generation config
+    :param dataset:
+    :param start:
+    :param end:
+    :param renderer_class: ModelRenderer or NumpyRenderer (see init_renderer)
+    :param window: opengl context of the current process
+    :param show: display the pairs (ESC stops the generation)
+    :param verbose:
+    :param position: line of the progress bar
+    :return:
+    """
+    sample_quantity = int(data["sample_quantity"])
+    translation_range = float(data["translation_range"])
+    rotation_range = math.radians(float(data["rotation_range"]))
+    image_size = (int(data["image_size"]), int(data["image_size"]))
+    sphere_sampler = UniformSphereSampler(float(data["sphere_min_radius"]), float(data["sphere_max_radius"]))
+    model = None
+    for i in tqdm(range(start, end), position=position):
+        if model is not data["models"][i // sample_quantity]:
+            model = data["models"][i // sample_quantity]
+            # only the crop of the sample is rendered, at the sample size
+            vpRender = renderer_class(model["model_path"], data["shader_path"], dataset.camera, window, image_size)
+            vpRender.load_ambiant_occlusion_map(model["ambiant_occlusion_model"])
+            object_width = int(model["object_width"])
+        random_pose = sphere_sampler.get_random()
+        random_transform = Transform.random((-translation_range, translation_range),
+                                            (-rotation_range, rotation_range))
+        pair = combine_view_transform(random_pose, random_transform)
+
+        bb = compute_2Dboundingbox(random_pose, dataset.camera, object_width, scale=(1000, 1000, -1000))
+        vpRender.setup_crop(dataset.camera, bb)
+        # the pose and its pair are drawn in one batch
+        (rgbA, rgbB), (depthA, depthB) = vpRender.render_batch([random_pose.transpose(), pair.transpose()],
+                                                               [None, sphere_sampler.random_direction()])
+
+        index = dataset.add_pose(rgbA, depthA, random_pose)
+        dataset.add_pair(rgbB, depthB, random_transform, index)
+
+        dataset.dump_images_on_disk()
+
+        if verbose:
+            show_frames(rgbA, depthA, rgbB, depthB)
+        if show:
+            cv2.imshow("testB", rgbB[:, :, ::-1])
+            k = cv2.waitKey(1)
+            if k == ESCAPE_KEY:
+                break
+
+
+def generation_worker(data, camera, metadata, worker, start, end, writer_processes):
+    """
+    Render the samples start to end - 1 in the dataset of the worker (a folder of the output path) with its own opengl
+    context, the first index is saved in the metadata for the merge (see merge_workers)
+    """
+    # forked workers share the random state of the parent
+    random.seed()
+    np.random.seed()
+    path = os.path.join(data["output_path"], WORKER_FOLDER.format(worker))
+    if not os.path.exists(path):
+        os.mkdir(path)
+    dataset = Dataset(path, frame_class=data["save_type"])
+    dataset.camera = camera
+    dataset.set_async_writer(writer_processes)
+    dataset.save_json_files(dict(metadata, first_index=str(start)))
+    renderer_class, window = init_renderer(data, camera.width, camera.height)
+    render_samples(data, dataset, start, end, renderer_class, window, position=worker)
+    dataset.dump_images_on_disk()
+    dataset.save_json_files(dict(metadata, first_index=str(start)))
+    dataset.close()
+
+
+def worker_paths(output_path):
+    return [os.path.join(output_path, name) for name in sorted(os.listdir(output_path))
+            if name.startswith(WORKER_FOLDER.split("{")[0])]
+
+
+def merge_workers(dataset, merge=True):
+    """
+    Append the samples of the worker datasets to dataset in index order and remove the worker folders. Samples of a
+    worker that do not follow the dataset (a previous worker was interrupted) are dropped.
+    :param dataset:
+    :param merge: if False the worker folders are only removed
+    :return:
+    """
+    for path in worker_paths(dataset.path):
+        worker_dataset = Dataset(path)
+        if merge and worker_dataset.load():
+            start = dataset.size() - int(worker_dataset.metadata["first_index"])
+            if 0 <= start <= worker_dataset.size():
+                dataset.append_dataset(worker_dataset, start)
+            else:
+                print("[WARNING] {} samples of {} do not follow the dataset and are dropped".format(
+                    worker_dataset.size(), path))
+        worker_dataset.frame_class.close(path)
+        shutil.rmtree(path)
 
 
 if __name__ == '__main__':
@@ -26,7 +148,6 @@ if __name__ == '__main__':
 
     # Populate important data from config file
     MODELS = data["models"]
-    SHADER_PATH = data["shader_path"]
     OUTPUT_PATH = data["output_path"]
     SAMPLE_QUANTITY = int(data["sample_quantity"])
     TRANSLATION_RANGE = float(data["translation_range"])
@@ -54,44 +175,41 @@ if __name__ == '__main__':
     camera = Camera.load_from_json(data["camera_path"])
     dataset = Dataset(OUTPUT_PATH, frame_class=data["save_type"])
     dataset.camera = camera
-    window_size = (camera.width, camera.height)
-    window = InitOpenGL(*window_size)
-    sphere_sampler = UniformSphereSampler(SPHERE_MIN_RADIUS, SPHERE_MAX_RADIUS)
-    preload_count = 0
     if PRELOAD:
         if dataset.load():
-            preload_count = dataset.size()
-            print("This Dataset already contains {} samples".format(preload_count))
-    # Iterate over all models from config files
-    for model in MODELS:
-        vpRender = ModelRenderer(model["model_path"], SHADER_PATH, dataset.camera, window, window_size)
-        vpRender.load_ambiant_occlusion_map(model["ambiant_occlusion_model"])
-        OBJECT_WIDTH = int(model["object_width"])
-        for i in tqdm(range(SAMPLE_QUANTITY - preload_count)):
-            random_pose = sphere_sampler.get_random()
-            random_transform = Transform.random((-TRANSLATION_RANGE, TRANSLATION_RANGE),
-                                                (-ROTATION_RANGE, ROTATION_RANGE))
-            pair = combine_view_transform(random_pose, random_transform)
-
-            rgbA, depthA = vpRender.render(random_pose.transpose())
-            rgbB, depthB = vpRender.render(pair.transpose(), sphere_sampler.random_direction())
-            bb = compute_2Dboundingbox(random_pose, dataset.camera, OBJECT_WIDTH, scale=(1000, -1000, -1000))
-            rgbA, depthA = normalize_scale(rgbA, depthA, bb, dataset.camera, IMAGE_SIZE)
-            rgbB, depthB = normalize_scale(rgbB, depthB, bb, dataset.camera, IMAGE_SIZE)
-
-            index = dataset.add_pose(rgbA, depthA, random_pose)
-            dataset.add_pair(rgbB, depthB, random_transform, index)
-
-            if i % 500 == 0:
-                dataset.dump_images_on_disk()
-            if i % 5000 == 0:
-                dataset.save_json_files(metadata)
-
-            if args.verbose:
-                show_frames(rgbA, depthA, rgbB, depthB)
-            cv2.imshow("testB", rgbB[:, :, ::-1])
-            k = cv2.waitKey(1)
-            if k == ESCAPE_KEY:
-                break
+            print("This Dataset already contains {} samples".format(dataset.size()))
+    # samples of workers interrupted with the previous run
+    merge_workers(dataset, merge=PRELOAD)
+    # metadata and camera are saved once, then each written sample is appended to the pose journal
+    dataset.save_json_files(metadata)
+    # sample i is a view of the model i // SAMPLE_QUANTITY
+    SAMPLE_TOTAL = SAMPLE_QUANTITY * len(MODELS)
+    PROCESS_QTY = int(data.get("generation_processes", "1"))
+    WRITER_PROCESSES = int(data.get("writer_processes", "4"))
+    if PROCESS_QTY > 1:
+        # each worker renders a contiguous range of the remaining samples with its own opengl context, the worker
+        # datasets are then appended in order. The parent process must not create an opengl context before the fork.
+        bounds = np.linspace(dataset.size(), SAMPLE_TOTAL, PROCESS_QTY + 1).astype(int)
+        workers = [multiprocessing.Process(target=generation_worker,
+                                           args=(data, camera, metadata, worker, bounds[worker], bounds[worker + 1],
+                                                 max(1, WRITER_PROCESSES // PROCESS_QTY)))
+                   for worker in range(PROCESS_QTY)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        merge_workers(dataset)
+        failed = [worker for worker in range(PROCESS_QTY) if workers[worker].exitcode != 0]
+        if failed:
+            print("[Error]: generation workers {} failed, the dataset holds {} samples".format(failed, dataset.size()))
+    else:
+        # frames are encoded and written in the background while the next samples are rendered
+        dataset.set_async_writer(WRITER_PROCESSES)
+        renderer_class, window = init_renderer(data, camera.width, camera.height)
+        render_samples(data, dataset, dataset.size(), SAMPLE_TOTAL, renderer_class, window, show=True,
+                       verbose=args.verbose)
     dataset.dump_images_on_disk()
     dataset.save_json_files(metadata)
+    dataset.close()
+    if PROCESS_QTY > 1 and failed:
+        sys.exit(-1)
@@ -0,0 +1,69 @@
+"""
+    Benchmark the gaussian blur of the data augmentation for each kernel size from 3 to blur_noise :
+    - convolve2d : previous DataAugmentation blur, scipy.signal.convolve2d of each channel with the 2D kernel (gkern)
+    - separable  : DataAugmentation.blur, 1D kernels along the rows then the columns of all the channels, in float32
+    - batch      : DataAugmentation.blur_batch on the whole minibatch
+
+    Times are per rgb + depth sample, the max difference is against convolve2d (in levels, after the cast to uint8).
+
+    usage : python tools/benchmark_blur.py [blur_noise] [image_size] [minibatch_size]
+"""
+from deeptracking.data.dataaugmentation import DataAugmentation
+import numpy as np
+import scipy.signal
+import time
+import sys
+
+
+def blur_convolve2d(rgb, depth, kernel_size):
+    kernel = DataAugmentation.gkern(kernel_size)
+    rgb = rgb.copy()
+    depth = depth.copy()
+    for channel in range(3):
+        rgb[:, :, channel] = scipy.signal.convolve2d(rgb[:, :, channel], kernel, mode='same')
+    depth[:, :] = scipy.signal.convolve2d(depth, kernel, mode='same')
+    return rgb, depth
+
+
+def blur_separable(rgb, depth, kernel_size):
+    rgb = rgb.copy()
+    depth = depth.copy()
+    rgb[:, :, :] = DataAugmentation.blur(rgb, kernel_size)
+    depth[:, :] = DataAugmentation.blur(depth, kernel_size)
+    return rgb, depth
+
+
+if __name__ == '__main__':
+    blur_noise = int(sys.argv[1]) if len(sys.argv) > 1 else 7
+    image_size = int(sys.argv[2]) if len(sys.argv) > 2 else 150
+    minibatch_size = int(sys.argv[3]) if len(sys.argv) > 3 else 64
+
+    rgbs = np.random.randint(0, 256, (minibatch_size, image_size, image_size, 3)).astype(np.uint8)
+    depths = np.random.randint(0, 3000, (minibatch_size, image_size, image_size)).astype(np.uint16)
+    print("{} samples of {}x{}, time per sample (ms)".format(minibatch_size, image_size, image_size))
+    print("\t{:>6} {:>12} {:>12} {:>12} {:>10}".format("kernel", "convolve2d", "separable", "batch", "max diff"))
+    for kernel_size in range(3, blur_noise + 1):
+        start_time = time.time()
+        references = [blur_convolve2d(rgb, depth, kernel_size) for rgb, depth in zip(rgbs, depths)]
+        convolve2d_time = (time.time() - start_time) / minibatch_size
+
+        start_time = time.time()
+        results = [blur_separable(rgb, depth, kernel_size) for rgb, depth in zip(rgbs, depths)]
+        separable_time = (time.time() - start_time) / minibatch_size
+
+        kernel_sizes = np.full(minibatch_size, kernel_size)
+        batch_rgbs = rgbs.copy()
+        batch_depths = depths.copy()
+        start_time = time.time()
+        DataAugmentation.blur_batch(batch_rgbs, kernel_sizes)
+        DataAugmentation.blur_batch(batch_depths, kernel_sizes)
+        batch_time = (time.time() - start_time) / minibatch_size
+
+        difference = 0
+        for i, (reference_rgb, reference_depth) in enumerate(references):
+            for rgb, depth in [results[i], (batch_rgbs[i], batch_depths[i])]:
+                difference = max(difference, np.abs(rgb.astype(int) - reference_rgb).max(),
+                                 np.abs(depth.astype(int) - reference_depth).max())
+        print("\t{:>6} {:>12.3f} {:>12.3f} {:>12.3f} {:>10}".format(kernel_size, convolve2d_time * 1000,
+                                                                   separable_time * 1000, batch_time * 1000,
+                                                                   difference))
@@ -0,0 +1,112 @@
+"""
+    Benchmark the load time and memory of a dataset's poses :
+    - json + transforms : previous Dataset.load, one (Frame, Transform) tuple per viewpoint and per pair
+    - json -> index     : legacy viewpoints.json read into the columnar PoseIndex
+    - npz index         : viewpoints.npz read in one go
+
+    usage : python tools/benchmark_dataset_load.py [sample_quantity ...]
+"""
+from deeptracking.data.dataset import Dataset
+from deeptracking.data.frame import Frame
+from deeptracking.data.poseindex import PoseIndex
+from deeptracking.utils.camera import Camera
+from deeptracking.utils.transform import Transform
+from multiprocessing import Process, Queue
+import numpy as np
+import tempfile
+import shutil
+import random
+import json
+import time
+import sys
+import os
+
+
+def current_rss():
+    with open("/proc/self/statm") as statm:
+        return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def load_transforms(path):
+    with open(os.path.join(path, "viewpoints.json")) as data_file:
+        data = json.load(data_file)
+    data_pose = []
+    data_pair = {}
+    for count in range(len(data) - 1):
+        id = str(count)
+        if id not in data:
+            break
+        pose = Transform.from_parameters(*[float(data[id]["vector"][str(x)]) for x in range(6)])
+        data_pose.append((Frame(None, None, id), pose))
+        for i in range(int(data[id]["pairs"])):
+            pair_id = "{}n{}".format(id, i)
+            pair_pose = Transform.from_parameters(*[float(data[pair_id]["vector"][str(x)]) for x in range(6)])
+            data_pair.setdefault(count, []).append((Frame(None, None, pair_id), pair_pose))
+    return data_pose, data_pair
+
+
+def load_dataset(path):
+    dataset = Dataset(path)
+    dataset.load()
+    return dataset
+
+
+def measure(loader, path, results):
+    rss = current_rss()
+    start_time = time.time()
+    data = loader(path)
+    load_time = time.time() - start_time
+    results.put((load_time, current_rss() - rss))
+
+
+def write_datasets(sample_quantity, folder):
+    poses = np.random.uniform(-1, 1, (sample_quantity, 6)).astype(np.float32)
+    pairs = np.random.uniform(-1, 1, (sample_quantity, 6)).astype(np.float32)
+    camera = Camera((500, 500), (320, 240), (640, 480))
+    metadata = {"save_type": "png", "image_size": "150", "translation_range": "0.02", "rotation_range": "0.17"}
+
+    legacy_path = os.path.join(folder, "json")
+    os.mkdir(legacy_path)
+    camera.save(legacy_path)
+    viewpoints = {"metaData": metadata}
+    for i in range(sample_quantity):
+        viewpoints[str(i)] = {"vector": {str(x): str(v) for x, v in enumerate(poses[i])}, "pairs": 1}
+        viewpoints["{}n0".format(i)] = {"vector": {str(x): str(v) for x, v in enumerate(pairs[i])}}
+    with open(os.path.join(legacy_path, "viewpoints.json"), 'w') as outfile:
+        json.dump(viewpoints, outfile)
+
+    binary_path = os.path.join(folder, "npz")
+    os.mkdir(binary_path)
+    camera.save(binary_path)
+    PoseIndex.from_arrays(poses, np.ones(sample_quantity, dtype=np.int32), pairs).save(binary_path)
+    with open(os.path.join(binary_path, "viewpoints.json"), 'w') as outfile:
+        json.dump({"metaData": metadata}, outfile)
+    return legacy_path, binary_path
+
+
+if __name__ == '__main__':
+    sample_quantities = [int(x) for x in sys.argv[1:]] or [100000, 1000000]
+    for sample_quantity in sample_quantities:
+        folder = tempfile.mkdtemp()
+        try:
+            legacy_path, binary_path = write_datasets(sample_quantity, folder)
+            print("{} samples".format(sample_quantity))
+            for name, loader, path in [("json + transforms", load_transforms, legacy_path),
+                                       ("json -> index", load_dataset, legacy_path),
+                                       ("npz index", load_dataset, binary_path)]:
+                results = Queue()
+                process = Process(target=measure, args=(loader, path, results))
+                process.start()
+                load_time, rss = results.get()
+                process.join()
+                print("\t{:<20} load : {:8.3f} s   rss : {:8.1f} MB".format(name, load_time, rss / 1e6))
+
+            dataset = load_dataset(binary_path)
+            indexes = [random.randint(0, sample_quantity - 1) for i in range(10000)]
+            start_time = time.time()
+            for index in indexes:
+                dataset.index.pose(index)
+                dataset.index.pair(index, 0)
+            print("\tpose + pair access : {:.2f} us".format((time.time() - start_time) / len(indexes) * 1e6))
+        finally:
+            shutil.rmtree(folder)
@@ -0,0 +1,98 @@
+"""
+    Compare the frame save types : bytes on disk, write time and read time (in order and in random order) per sample.
+
+    Frames are taken from an existing dataset if a path is given, otherwise synthetic renders (a shaded object on a
+    black background) are generated.
+
+    usage : python tools/benchmark_frame_formats.py [dataset_path] [sample_quantity]
+"""
+from deeptracking.data.dataset import Dataset
+from deeptracking.data.shardstorage import ShardStorage
+from deeptracking.data.chunkstorage import ChunkStorage
+from deeptracking.data.framecodecs import CODECS
+from deeptracking.utils.transform import Transform
+import numpy as np
+import tempfile
+import shutil
+import time
+import sys
+import os
+
+
+def synthetic_frame(size=150):
+    y, x = np.mgrid[-1:1:size * 1j, -1:1:size * 1j]
+    a, b = np.random.uniform(0.4, 0.8, 2)
+    cx, cy = np.random.uniform(-0.2, 0.2, 2)
+    r2 = ((x - cx) / a) ** 2 + ((y - cy) / b) ** 2
+    mask = r2 < 1
+    shade = np.sqrt(np.clip(1 - r2, 0, 1))
+    color = np.random.uniform(50, 255, 3)
+    rgb = (shade[:, :, np.newaxis] * color).astype(np.uint8) * mask[:, :, np.newaxis]
+    depth = ((800 - 60 * shade) * mask).astype(np.uint16)
+    return rgb, depth
+
+
+def storage_bytes(path):
+    files = [f for f in os.listdir(path) if not f.startswith("viewpoints") and f != "camera.json"]
+    return sum(os.path.getsize(os.path.join(path, f)) for f in files)
+
+
+def benchmark(save_type, frames, folder):
+    path = os.path.join(folder, save_type.replace(":", "_"))
+    os.mkdir(path)
+    dataset = Dataset(path, frame_class=save_type)
+    start_time = time.time()
+    for rgb, depth in frames:
+        dataset.add_pose(rgb, depth, Transform())
+    dataset.dump_images_on_disk()
+    write_time = time.time() - start_time
+
+    # fresh storages : nothing cached from the writes
+    ShardStorage.storages = {}
+    ChunkStorage.storages = {}
+    index = dataset.index
+    dataset = Dataset(path, frame_class=save_type)
+    dataset.index = index
+    start_time = time.time()
+    for i in range(len(frames)):
+        dataset.load_image(i)
+    sequential_time = time.time() - start_time
+    start_time = time.time()
+    for i in np.random.permutation(len(frames)):
+        dataset.load_image(i)
+    random_time = time.time() - start_time
+    sample_qty = float(len(frames))
+    return storage_bytes(path) / sample_qty, write_time / sample_qty, sequential_time / sample_qty, \
+        random_time / sample_qty
+
+
+if __name__ == '__main__':
+    dataset_path = sys.argv[1] if len(sys.argv) > 1 else ""
+    sample_quantity = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+
+    if dataset_path != "":
+        input_dataset = Dataset(dataset_path)
+        if not input_dataset.load():
+            print("[Error]: Dataset {} is empty".format(dataset_path))
+            sys.exit(-1)
+        frames = [input_dataset.load_image(i)[:2] for i in range(min(sample_quantity, input_dataset.size()))]
+    else:
+        frames = [synthetic_frame() for i in range(sample_quantity)]
+    raw_size = frames[0][0].nbytes + frames[0][1].nbytes
+
+    save_types = ["png", "numpy", "shard"] + ["chunk:{}:{}".format(codec, chunk_size) for codec in sorted(CODECS)
+                                              for chunk_size in [1, 16]]
+    folder = tempfile.mkdtemp()
+    try:
+        print("{} frames of {}x{} ({} bytes uncompressed)\n".format(len(frames), frames[0][1].shape[1],
+                                                                     frames[0][1].shape[0], raw_size))
+        print("| save type | bytes/sample | ratio | write us/sample | read us/sample (in order) | "
+              "read us/sample (random) |")
+        print("|---|---|---|---|---|---|")
+        for save_type in save_types:
+            size, write_time, sequential_time, random_time = benchmark(save_type, frames, folder)
+            print("| {} | {:.0f} | {:.2f} | {:.0f} | {:.0f} | {:.0f} |".format(save_type, size, raw_size / size,
+                                                                             write_time * 1e6, sequential_time * 1e6,
+                                                                             random_time * 1e6))
+    finally:
+        shutil.rmtree(folder)
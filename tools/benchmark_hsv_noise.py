@@ -0,0 +1,60 @@
+"""
+    Benchmark the hsv noise of the data augmentation for each combination of shifted channels (hue, saturation, value) :
+    - skimage    : previous DataAugmentation.add_hsv_noise, rgb2hsv and hsv2rgb of the image in float64
+    - shift_hsv  : DataAugmentation.shift_hsv of each image, lookup tables of the value and hue rotation in float32
+    - batch      : DataAugmentation.shift_hsv on the whole minibatch
+
+    Times are per sample, the max difference is against skimage (in levels), the differing pixels are mostly the levels
+    lost by the truncation of the float64 round-trip.
+
+    usage : python tools/benchmark_hsv_noise.py [image_size] [minibatch_size]
+"""
+from deeptracking.data.dataaugmentation import DataAugmentation
+from skimage.color import rgb2hsv, hsv2rgb
+import itertools
+import numpy as np
+import time
+import sys
+
+
+def shift_skimage(rgb, offsets, shifted):
+    mask = np.all(rgb != 0, axis=2)
+    hsv = rgb2hsv(rgb)
+    for channel in range(3):
+        if shifted[channel]:
+            hsv[:, :, channel] = (hsv[:, :, channel] + offsets[channel]) % 1
+    rgb = hsv2rgb(hsv) * 255
+    return rgb.astype(np.uint8) * mask[:, :, np.newaxis]
+
+
+if __name__ == '__main__':
+    image_size = int(sys.argv[1]) if len(sys.argv) > 1 else 150
+    minibatch_size = int(sys.argv[2]) if len(sys.argv) > 2 else 64
+
+    rgbs = np.random.randint(0, 256, (minibatch_size, image_size, image_size, 3)).astype(np.uint8)
+    offsets = np.random.uniform(-0.3, 0.3, (minibatch_size, 3)).astype(np.float32)
+    print("{} samples of {}x{}, time per sample (ms)".format(minibatch_size, image_size, image_size))
+    print("\t{:>7} {:>10} {:>10} {:>10} {:>10} {:>12}".format("shifted", "skimage", "shift_hsv", "batch", "max diff",
+                                                              "diff pixels"))
+    for channels in itertools.product([False, True], repeat=3):
+        shifted = np.tile(channels, (minibatch_size, 1))
+        start_time = time.time()
+        references = [shift_skimage(rgb, offsets[i], channels) for i, rgb in enumerate(rgbs)]
+        skimage_time = (time.time() - start_time) / minibatch_size
+
+        start_time = time.time()
+        results = [DataAugmentation.shift_hsv(rgbs[i:i + 1], offsets[i:i + 1], shifted[i:i + 1])[0]
+                   for i in range(minibatch_size)]
+        shift_time = (time.time() - start_time) / minibatch_size
+
+        start_time = time.time()
+        batch = DataAugmentation.shift_hsv(rgbs, offsets, shifted)
+        batch_time = (time.time() - start_time) / minibatch_size
+
+        references = np.stack(references).astype(int)
+        difference = max(np.abs(np.stack(results) - references).max(), np.abs(batch - references).max())
+        different = np.any(batch != references, axis=3).mean()
+        name = "".join(letter if channel else "-" for letter, channel in zip("hsv", channels))
+        print("\t{:>7} {:>10.3f} {:>10.3f} {:>10.3f} {:>10} {:>11.2f}%".format(name, skimage_time * 1000,
+                                                                             shift_time * 1000, batch_time * 1000,
+                                                                             difference, different * 100))
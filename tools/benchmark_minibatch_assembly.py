@@ -0,0 +1,68 @@
+"""
+    Benchmark the assembly of a minibatch from raw frames :
+    - per sample : Dataset.get_sample called for each sample of the minibatch
+    - batched    : Dataset.get_samples, depth normalization, mean/std scaling and transpose done on the whole minibatch
+
+    Frames are kept in ram (the loading time is not measured) and the minibatches of both paths are compared.
+
+    usage : python tools/benchmark_minibatch_assembly.py [image_size] [minibatch_size] [iterations]
+"""
+from deeptracking.data.dataset import Dataset
+from deeptracking.utils.transform import Transform
+import numpy as np
+import time
+import sys
+
+
+class RamDataset(Dataset):
+    """
+    Dataset serving random frames from ram, to measure the assembly only
+    """
+    def __init__(self, image_size, sample_quantity):
+        Dataset.__init__(self, "", minibatch_size=sample_quantity)
+        self.metadata = {"image_size": str(image_size), "translation_range": "0.02", "rotation_range": "0.17"}
+        self.rgbs = np.random.randint(0, 255, (sample_quantity, 2, image_size, image_size, 3)).astype(np.uint8)
+        self.depths = np.random.randint(0, 3000, (sample_quantity, 2, image_size, image_size)).astype(np.uint16)
+        self.depths[:, :, :image_size // 4] = 0
+        for i in range(sample_quantity):
+            index = self.index.add_pose(Transform.random((-0.02, 0.02), (-0.17, 0.17)).to_parameters())
+            self.index.add_pair(index, Transform.random((-0.02, 0.02), (-0.17, 0.17)).to_parameters())
+
+    def load_image(self, index):
+        return self.rgbs[index, 0], self.depths[index, 0], self.index.pose(index)
+
+    def load_pair(self, index, pair_id):
+        return self.rgbs[index, 1], self.depths[index, 1], self.index.pair(index, pair_id)
+
+
+def assemble_per_sample(dataset, task, buffers):
+    for buffer_index, index in enumerate(task):
+        dataset.get_sample(index, *buffers, buffer_index)
+
+
+def assemble_batched(dataset, task, buffers):
+    dataset.get_samples(task, *buffers)
+
+
+if __name__ == '__main__':
+    image_size = int(sys.argv[1]) if len(sys.argv) > 1 else 150
+    minibatch_size = int(sys.argv[2]) if len(sys.argv) > 2 else 64
+    iterations = int(sys.argv[3]) if len(sys.argv) > 3 else 20
+
+    dataset = RamDataset(image_size, minibatch_size)
+    dataset.mean = np.random.uniform(0, 255, 8)
+    dataset.std = np.random.uniform(1, 100, 8)
+    task = np.arange(minibatch_size)
+    print("minibatch of {} samples of {}x{}".format(minibatch_size, image_size, image_size))
+    results = {}
+    for name, assemble in [("per sample", assemble_per_sample), ("batched", assemble_batched)]:
+        buffers = [np.empty(shape, dtype=dtype) for shape, dtype in dataset.minibatch_buffers_()]
+        assemble(dataset, task, buffers)
+        start_time = time.time()
+        for i in range(iterations):
+            assemble(dataset, task, buffers)
+        elapsed_time = (time.time() - start_time) / iterations
+        results[name] = buffers
+        print("\t{:<12} : {:8.2f} ms/minibatch   {:8.0f} samples/s".format(name, elapsed_time * 1000,
+                                                                           minibatch_size / elapsed_time))
+    print("\tmax difference : {}".format(np.max(np.abs(results["per sample"][0] - results["batched"][0]))))
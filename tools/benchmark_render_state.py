@@ -0,0 +1,87 @@
+"""
+    Benchmark the opengl state cache of ModelRenderer (see deeptracking/data/glstate.py) : opengl calls and time per
+    render, with every state call issued (cache disabled) and with the redundant calls skipped (cache enabled).
+
+    Random poses are rendered as in the synthetic data generation : crop of the object at the sample size, random light
+    direction for one render out of two.
+
+    usage : python tools/benchmark_render_state.py model.ply [render_quantity] [image_size]
+"""
+from deeptracking.data.modelrenderer import ModelRenderer, InitOpenGL
+from deeptracking.data.dataset_utils import compute_2Dboundingbox
+from deeptracking.data.glstate import gl_state
+from deeptracking.utils.camera import Camera
+from deeptracking.utils.uniform_sphere_sampler import UniformSphereSampler
+import deeptracking.data.modelrenderer as modelrenderer
+import deeptracking.data.glstate as glstate
+from collections import Counter
+import time
+import sys
+import os
+
+
+class CallCounter:
+    """
+    Count the opengl calls of the renderer modules by wrapping their gl functions
+    """
+    def __init__(self, modules):
+        self.calls = Counter()
+        for module in modules:
+            for name in dir(module):
+                function = getattr(module, name)
+                if name.startswith("gl") and name[2:3].isupper() and callable(function):
+                    setattr(module, name, self.wrap_(name, function))
+
+    def wrap_(self, name, function):
+        def counted(*args, **kwargs):
+            self.calls[name] += 1
+            return function(*args, **kwargs)
+        return counted
+
+
+def render_poses(renderer, camera, poses, light_directions):
+    for pose, light_direction in zip(poses, light_directions):
+        bb = compute_2Dboundingbox(pose, camera, 250, scale=(1000, 1000, -1000))
+        renderer.setup_crop(camera, bb)
+        renderer.render(pose.transpose(), light_direction)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print("usage : python tools/benchmark_render_state.py model.ply [render_quantity] [image_size]")
+        sys.exit(-1)
+    model_path = sys.argv[1]
+    render_quantity = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    image_size = int(sys.argv[3]) if len(sys.argv) > 3 else 150
+    shader_path = os.path.join(os.path.dirname(os.path.abspath(modelrenderer.__file__)), "shaders")
+
+    camera = Camera((575.8, 575.8), (320, 240), (640, 480))
+    window = InitOpenGL(camera.width, camera.height)
+    counter = CallCounter([modelrenderer, glstate])
+    renderer = ModelRenderer(model_path, shader_path, camera, window, (image_size, image_size))
+    sampler = UniformSphereSampler(0.4, 1.2)
+    poses = [sampler.get_random() for i in range(render_quantity)]
+    light_directions = [sampler.random_direction() if i % 2 else None for i in range(render_quantity)]
+
+    print("{} renders of {}x{}".format(render_quantity, image_size, image_size))
+    configs = [("no cache", False), ("cache", True)]
+    calls = {}
+    elapsed_times = {name: [] for name, enabled in configs}
+    render_poses(renderer, camera, poses[:10], light_directions[:10])
+    # the configurations are alternated, the best time of the rounds is kept
+    for i in range(3):
+        for name, enabled in configs:
+            gl_state.enabled = enabled
+            counter.calls.clear()
+            start_time = time.time()
+            render_poses(renderer, camera, poses, light_directions)
+            elapsed_times[name].append((time.time() - start_time) / render_quantity)
+            calls[name] = dict(counter.calls)
+    for name, enabled in configs:
+        print("\t{:<10} : {:6.1f} gl calls/render   {:8.3f} ms/render".format(
+            name, sum(calls[name].values()) / render_quantity, min(elapsed_times[name]) * 1000))
+    print("\tskipped calls per render :")
+    for name in sorted(calls["no cache"]):
+        skipped = calls["no cache"][name] - calls["cache"].get(name, 0)
+        if skipped:
+            print("\t\t{:<22} {:6.2f}".format(name, skipped / render_quantity))
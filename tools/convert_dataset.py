@@ -0,0 +1,45 @@
+"""
+    Copy a dataset to a new folder with another frame format (png, numpy, shard or chunk)
+
+    usage : python tools/convert_dataset.py input_path output_path save_type
+"""
+from deeptracking.data.dataset import Dataset
+from tqdm import tqdm
+import sys
+import os
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 4:
+        print("usage : python tools/convert_dataset.py input_path output_path save_type")
+        sys.exit(-1)
+    input_path, output_path, save_type = sys.argv[1:]
+
+    if not os.path.exists(output_path):
+        os.mkdir(output_path)
+
+    dataset = Dataset(input_path)
+    if not dataset.load():
+        print("[Error]: Dataset {} is empty".format(input_path))
+        sys.exit(-1)
+
+    metadata = dict(dataset.metadata)
+    metadata["save_type"] = save_type
+    output_dataset = Dataset(output_path, frame_class=save_type)
+    output_dataset.camera = dataset.camera
+    output_dataset.metadata = metadata
+    output_dataset.set_async_writer()
+
+    print("Convert {} ({}) into {} ({})".format(input_path, dataset.metadata["save_type"], output_path, save_type))
+    for i in tqdm(range(dataset.size())):
+        rgb, depth, pose = dataset.load_image(i)
+        index = output_dataset.add_pose(rgb, depth, pose)
+        for j in range(dataset.pair_size(i)):
+            rgb_pair, depth_pair, pair_pose = dataset.load_pair(i, j)
+            output_dataset.add_pair(rgb_pair, depth_pair, pair_pose, index)
+
+        output_dataset.dump_images_on_disk()
+
+    output_dataset.dump_images_on_disk()
+    output_dataset.save_json_files(metadata)
+    output_dataset.close()
@@ -36,6 +36,8 @@ if __name__ == '__main__':
     output_dataset = Dataset(output_path, frame_class=metadata["save_type"])
     output_dataset.camera = camera
     output_dataset.metadata = metadata
+    output_dataset.set_async_writer()
+    output_dataset.save_json_files(metadata)
 
     # transfer data
     for dataset in datasets:
@@ -47,10 +49,8 @@ if __name__ == '__main__':
             index = output_dataset.add_pose(rgbA, depthA, initial_pose)
             output_dataset.add_pair(rgbB, depthB, transformed_pose, index)
 
-            if i % 500 == 0:
-                output_dataset.dump_images_on_disk()
-            if i % 5000 == 0:
-                output_dataset.save_json_files(metadata)
+            output_dataset.dump_images_on_disk()
 
     output_dataset.dump_images_on_disk()
-    output_dataset.save_json_files(metadata)
\ No newline at end of file
+    output_dataset.save_json_files(metadata)
+    output_dataset.close()
\ No newline at end of file
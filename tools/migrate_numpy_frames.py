@@ -0,0 +1,47 @@
+"""
+    Rewrite, in place, the frames of a numpy dataset saved as h x w x 5 uint8 arrays in the structured record format of
+    FrameNumpy (rgb uint8 and depth uint16 planes). Frames already migrated are skipped, so the tool can be run again
+    if it is interrupted.
+
+    usage : python tools/migrate_numpy_frames.py dataset_path
+"""
+from deeptracking.data.dataset import Dataset
+from deeptracking.data.frame import FrameNumpy
+from tqdm import tqdm
+import numpy as np
+import sys
+import os
+
+
+def migrate_frame(path, id):
+    file_path = os.path.join(path, "{}.npy".format(id))
+    frame = np.load(file_path)
+    if not FrameNumpy.is_legacy(frame):
+        return False
+    rgb, depth = FrameNumpy.from_legacy(frame)
+    with open(file_path + ".tmp", 'wb') as outfile:
+        np.save(outfile, FrameNumpy.to_record(rgb, depth))
+    os.replace(file_path + ".tmp", file_path)
+    return True
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        print("usage : python tools/migrate_numpy_frames.py dataset_path")
+        sys.exit(-1)
+    dataset_path = sys.argv[1]
+
+    dataset = Dataset(dataset_path)
+    if not dataset.load():
+        print("[Error]: Dataset {} is empty".format(dataset_path))
+        sys.exit(-1)
+    if dataset.metadata["save_type"] != "numpy":
+        print("[Error]: Dataset {} save type is {}, not numpy".format(dataset_path, dataset.metadata["save_type"]))
+        sys.exit(-1)
+
+    migrated = 0
+    for i in tqdm(range(dataset.size())):
+        ids = [dataset.get_frame(i).id] + [dataset.get_pair_frame(i, j).id for j in range(dataset.pair_size(i))]
+        for id in ids:
+            migrated += migrate_frame(dataset_path, id)
+    print("{} frames migrated".format(migrated))
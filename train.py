@@ -74,6 +74,15 @@ def config_datasets(data):
     train_path = data["train_path"]
     valid_path = data["valid_path"]
     minibatch_size = int(data["minibatch_size"])
+    # with a seed, minibatches are delivered in order and each one gets its own seeded random state (replayable runs),
+    # train and valid use different streams of the seed
+    seed = None if data.get("seed", "") == "" else int(data["seed"])
+    # parallel loader : number of workers, minibatches loaded ahead and memory cap of the loaded minibatches
+    loader = data.get("loader", {})
+    process_qty = int(loader.get("process_qty", "0"))
+    prefetch = int(loader.get("prefetch", "0"))
+    max_memory = int(float(loader.get("max_memory_mb", "0")) * 1e6)
+    cache_size = int(float(loader.get("cache_mb", "0")) * 1e6)
     rgb_noise = float(data["data_augmentation"]["rgb_noise"])
     depth_noise = float(data["data_augmentation"]["depth_noise"])
     occluder_path = data["data_augmentation"]["occluder_path"]
@@ -97,19 +106,31 @@ def config_datasets(data):
     data_augmentation.set_hsv_noise(h_noise, s_noise, v_noise)
 
     message_logger.info("Setup Train : {}".format(train_path))
-    train_dataset = Dataset(train_path, minibatch_size=minibatch_size)
+    train_dataset = Dataset(train_path, minibatch_size=minibatch_size, max_parallel_buffer_size=prefetch,
+                            shared_memory=True, ordered=seed is not None, seed=seed, process_qty=process_qty,
+                            max_memory=max_memory, stream=0)
     if not train_dataset.load():
         message_logger.error("Train dataset empty")
         sys.exit(-1)
     train_dataset.set_data_augmentation(data_augmentation)
-    train_dataset.compute_mean_std()
-    message_logger.info("Computed mean : {}\nComputed Std : {}".format(train_dataset.mean, train_dataset.std))
     message_logger.info("Setup Valid : {}".format(valid_path))
-    valid_dataset = Dataset(valid_path, minibatch_size=minibatch_size, max_samples=20000)
+    valid_dataset = Dataset(valid_path, minibatch_size=minibatch_size, max_parallel_buffer_size=prefetch,
+                            max_samples=20000, shared_memory=True, ordered=seed is not None, seed=seed,
+                            process_qty=process_qty, max_memory=max_memory, stream=1)
     if not valid_dataset.load():
         message_logger.error("Valid dataset empty")
         sys.exit(-1)
     valid_dataset.set_data_augmentation(data_augmentation)
+    if cache_size > 0:
+        # the cache budget is shared by train and valid, in proportion of their number of samples
+        train_cache_size = cache_size * train_dataset.size() // (train_dataset.size() + valid_dataset.size())
+        train_dataset.set_sample_cache(train_cache_size)
+        valid_dataset.set_sample_cache(cache_size - train_cache_size)
+    if train_dataset.load_mean_std():
+        message_logger.info("Loaded mean : {}\nLoaded Std : {}".format(train_dataset.mean, train_dataset.std))
+    else:
+        train_dataset.compute_mean_std()
+        message_logger.info("Computed mean : {}\nComputed Std : {}".format(train_dataset.mean, train_dataset.std))
     valid_dataset.mean = train_dataset.mean
     valid_dataset.std = train_dataset.std
     return train_dataset, valid_dataset
@@ -179,6 +200,10 @@ def train_loop(model, dataset, logger, log_message_ratio=0.01):
                 message_logger.info("[{}%] : Train loss: {}".format(int(progression), losses["label"]))
                 elapsed_time = time.time() - start_time
                 message_logger.info("Time/batch : {}h".format((100 * elapsed_time / progression)/3600))
+                loader_statistics = dataset.get_statistics()
+                message_logger.info("Loader : {}".format(", ".join("{}: {:.4f}".format(name, loader_statistics[name])
+                                                                   for name in sorted(loader_statistics))))
+                logger.add_row("Loader", [loader_statistics.get(name, 0.) for name in logger.get_dataframe_columns("Loader")])
 
     total_loss = data_logger.get_as_numpy("Minibatch")[:, 0]
     mean_loss = 0 if len(total_loss) < 5 else np.mean(total_loss[-5:])
@@ -217,6 +242,7 @@ if __name__ == '__main__':
     data_logger.create_dataframe("Minibatch", ["Train"])
     data_logger.create_dataframe("Grad_Rotation", ["grad_rot_mean", "grad_rot_median", "grad_rot_min", "grad_rot_max"])
     data_logger.create_dataframe("Grad_Translation", ["grad_trans_mean", "grad_trans_median", "grad_trans_min", "grad_trans_max"])
+    data_logger.create_dataframe("Loader", ["queue_wait", "load", "augment", "normalize", "samples_per_sec"])
 
     message_logger.info("Setup Datasets")
     train_dataset, valid_dataset = config_datasets(data)
@@ -252,6 +278,8 @@ if __name__ == '__main__':
             early_stop_wait += 1
             if early_stop_wait > EARLY_STOP_WAIT_LIMIT:
                 break
+    train_dataset.terminate_processes()
+    valid_dataset.terminate_processes()
     message_logger.slack("Train Terminated at {}".format(get_current_time()))
     message_logger.slack("Total Epoch: {}\nBest Validation Loss: {}".format(best_epoch, best_validation_loss))
 